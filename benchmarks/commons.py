@@ -0,0 +1,135 @@
+import math
+from typing import List, Tuple
+
+import numpy as np
+
+from slaid.commons.base import ArrayImage, BasicSlide, Image, ImageInfo
+
+
+class SyntheticSlide(BasicSlide):
+    """
+    In-memory slide with random pixels, levels downsampled by 2.
+    Channel values are multiples of colour_step, which bounds the number
+    of distinct colours to (256 / colour_step)**3.
+    """
+    IMAGE_INFO = ImageInfo.create('rgb', 'yx', 'last')
+
+    def __init__(self,
+                 dimensions: Tuple[int, int] = (8192, 8192),
+                 level_count: int = 3,
+                 tile_size: Tuple[int, int] = (256, 256),
+                 seed: int = 0,
+                 colour_step: int = 1):
+        super().__init__('synthetic')
+        random = np.random.RandomState(seed)
+        self._level_dimensions = [(dimensions[0] // 2**level,
+                                   dimensions[1] // 2**level)
+                                  for level in range(level_count)]
+        self._level_downsamples = [2.**level for level in range(level_count)]
+        self._levels = [
+            random.randint(0, 256, (height, width, 3), dtype='uint8') //
+            colour_step * colour_step
+            for width, height in self._level_dimensions
+        ]
+        self._tile_size = tile_size
+
+    @property
+    def dimensions(self) -> Tuple[int, int]:
+        return self._level_dimensions[0]
+
+    def read_region(self, location: Tuple[int, int], level: int,
+                    size: Tuple[int, int]) -> Image:
+        x, y = [
+            int(round(c / self._level_downsamples[level])) for c in location
+        ]
+        width, height = size
+        region = np.zeros((height, width, 3), dtype='uint8')
+        data = self._levels[level][max(y, 0):y + height, max(x, 0):x + width]
+        region[max(-y, 0):max(-y, 0) + data.shape[0],
+               max(-x, 0):max(-x, 0) + data.shape[1]] = data
+        return ArrayImage(region, self.IMAGE_INFO)
+
+    def get_best_level_for_downsample(self, downsample: int):
+        return max(
+            level
+            for level, level_downsample in enumerate(self._level_downsamples)
+            if level_downsample <= downsample)
+
+    @property
+    def level_dimensions(self) -> List[Tuple[int, int]]:
+        return self._level_dimensions
+
+    @property
+    def level_downsamples(self) -> List[float]:
+        return self._level_downsamples
+
+    @property
+    def level_tile_sizes(self) -> List[Tuple[int, int]]:
+        return [self._tile_size] * self.level_count
+
+
+class DecodeCounter(BasicSlide):
+    """
+    Wraps a slide reader and counts the native tiles touched by each
+    read_region, i.e. the tiles the underlying library has to decode.
+    """
+
+    def __init__(self, slide_reader: BasicSlide):
+        super().__init__(slide_reader.filename)
+        self.IMAGE_INFO = slide_reader.IMAGE_INFO
+        self._slide_reader = slide_reader
+        self.reads = 0
+        self.decoded_tiles = 0
+        self._seen_tiles = set()
+
+    @property
+    def unique_tiles(self) -> int:
+        return len(self._seen_tiles)
+
+    @property
+    def dimensions(self) -> Tuple[int, int]:
+        return self._slide_reader.dimensions
+
+    def read_region(self, location: Tuple[int, int], level: int,
+                    size: Tuple[int, int]) -> Image:
+        self.reads += 1
+        tile_width, tile_height = self.level_tile_sizes[level]
+        level_width, level_height = self.level_dimensions[level]
+        x, y = [
+            int(round(c / self.level_downsamples[level])) for c in location
+        ]
+        x_stop = min(x + size[0], level_width)
+        y_stop = min(y + size[1], level_height)
+        for tile_y in range(
+                max(y, 0) // tile_height, math.ceil(y_stop / tile_height)):
+            for tile_x in range(
+                    max(x, 0) // tile_width, math.ceil(x_stop / tile_width)):
+                self.decoded_tiles += 1
+                self._seen_tiles.add((level, tile_x, tile_y))
+        return self._slide_reader.read_region(location, level, size)
+
+    def get_best_level_for_downsample(self, downsample: int):
+        return self._slide_reader.get_best_level_for_downsample(downsample)
+
+    @property
+    def level_dimensions(self) -> List[Tuple[int, int]]:
+        return self._slide_reader.level_dimensions
+
+    @property
+    def level_downsamples(self) -> List[float]:
+        return self._slide_reader.level_downsamples
+
+    @property
+    def level_tile_sizes(self) -> List[Tuple[int, int]]:
+        return self._slide_reader.level_tile_sizes
+
+
+class ConstantModel:
+    image_info = ImageInfo.create('rgb', 'yx', 'last')
+    patch_size = None
+
+    def __str__(self):
+        return self.__class__.__name__
+
+    def predict(self, array: np.ndarray) -> np.ndarray:
+        return np.zeros(array.shape[0], dtype='float32')
@@ -0,0 +1,76 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Throughput of PixelClassifier with and without unique-colour
+deduplication, on a pixel model shaped like TissueModel.
+
+    python -m benchmarks.dedup [--size 4096] [--colour-step 8]
+"""
+import time
+
+import numpy as np
+from clize import run
+
+from benchmarks.commons import SyntheticSlide
+from slaid.classifiers.fixed_batch import PixelClassifier
+from slaid.commons.base import ImageInfo, Slide
+
+
+class MLPModel:
+    """
+    Random 3-50-50-50-2 dense network, as the tissue model.
+    """
+    image_info = ImageInfo.create('rgb', 'yx', 'last')
+    patch_size = None
+
+    def __init__(self, seed: int = 0):
+        random = np.random.RandomState(seed)
+        sizes = [3, 50, 50, 50, 2]
+        self._weights = [
+            random.normal(size=(n_in, n_out)).astype('float32') / n_in
+            for n_in, n_out in zip(sizes[:-1], sizes[1:])
+        ]
+
+    def __str__(self):
+        return self.__class__.__name__
+
+    def predict(self, array: np.ndarray) -> np.ndarray:
+        layer = array.astype('float32') / 255
+        for weights in self._weights[:-1]:
+            layer = np.maximum(layer @ weights, 0)
+        layer = layer @ self._weights[-1]
+        layer = np.exp(layer - layer.max(axis=1, keepdims=True))
+        return layer[:, 1] / layer.sum(axis=1)
+
+
+def main(*,
+         size: int = 4096,
+         colour_step: int = 8,
+         batch_size: int = 2**20,
+         chunk_size: int = 1024):
+    """
+    :param size: side of the synthetic level
+    :param colour_step: slide channel values are multiples of this
+    :param batch_size: pixels per prediction
+    :param chunk_size: rows read at once
+    """
+    slide = Slide(
+        SyntheticSlide((size, size), level_count=1, colour_step=colour_step))
+    print(f'{"dedup":>6} {"seconds":>8} {"Mpixel/s":>9}')
+    masks = []
+    for dedup in (False, True):
+        classifier = PixelClassifier(MLPModel(),
+                                     'benchmark',
+                                     chunk_size=chunk_size,
+                                     dedup=dedup)
+        start = time.perf_counter()
+        mask = classifier.classify(slide, level=0, batch_size=batch_size)
+        elapsed = time.perf_counter() - start
+        masks.append(mask.array)
+        print(f'{str(dedup):>6} {elapsed:>8.2f} '
+              f'{size**2 / elapsed / 1e6:>9.1f}')
+    assert (masks[0] == masks[1]).all()
+
+
+if __name__ == '__main__':
+    run(main)
@@ -0,0 +1,82 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Time and peak memory of BasicClassifier writing each block in place in a
+preallocated output, against the previous np.append row assembly.
+
+    python -m benchmarks.preallocated_output [--size 8192] [--chunk 512]
+"""
+import time
+import tracemalloc
+
+import numpy as np
+from clize import run
+
+from benchmarks.commons import ConstantModel, SyntheticSlide
+from slaid.classifiers import BasicClassifier
+from slaid.commons.base import Slide
+from slaid.commons.zarr import ArrayFactory as ZarrArrayFactory
+
+
+class AppendingClassifier(BasicClassifier):
+    """
+    Output assembly as done before: blocks appended to rows and rows
+    appended to the predictions with np.append.
+    """
+
+    def _classify_pixels(self, slide_array, chunk, threshold, round_to_0_100,
+                         dtype):
+        predictions = self.array_factory.empty((0, slide_array.size[1]),
+                                               dtype=dtype)
+        for x in range(0, slide_array.size[0], chunk[0]):
+            row = np.empty((min(chunk[0], slide_array.size[0] - x), 0),
+                           dtype=dtype)
+            for y in range(0, slide_array.size[1], chunk[1]):
+                block = slide_array[x:x + chunk[0], y:y + chunk[1]].convert(
+                    self.model.image_info)
+                res = np.zeros(block.size, dtype='float32')
+                res[:] = self._predict(block.array.reshape(-1, 3)).reshape(
+                    block.size)
+                res = self._threshold(res, threshold)
+                res = self._round_to_0_100(res, round_to_0_100)
+                row = np.append(row, res, 1)
+            if isinstance(predictions, np.ndarray):
+                predictions = np.append(predictions, row, 0)
+            else:
+                predictions.append(row, 0)
+        return predictions
+
+
+def _measure(classifier, slide, level):
+    tracemalloc.start()
+    start = time.perf_counter()
+    mask = classifier.classify(slide, level=level)
+    elapsed = time.perf_counter() - start
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return mask, elapsed, peak
+
+
+def main(*, size: int = 8192, chunk: int = 512, use_zarr: 'zarr' = False):
+    """
+    :param size: side of the synthetic level
+    :param chunk: side of the classified blocks
+    :param use_zarr: write the output to an in-memory zarr array
+    """
+    slide = Slide(SyntheticSlide((size, size), level_count=1))
+    print(f'{"classifier":>20} {"seconds":>8} {"peak MiB":>9}')
+    masks = []
+    for cls in (AppendingClassifier, BasicClassifier):
+        array_factory = ZarrArrayFactory() if use_zarr else None
+        classifier = cls(ConstantModel(),
+                         'benchmark',
+                         array_factory=array_factory,
+                         chunk=(chunk, chunk))
+        mask, elapsed, peak = _measure(classifier, slide, 0)
+        masks.append(mask.array)
+        print(f'{cls.__name__:>20} {elapsed:>8.2f} {peak / 1024**2:>9.1f}')
+    assert (np.array(masks[0]) == np.array(masks[1])).all()
+
+
+if __name__ == '__main__':
+    run(main)
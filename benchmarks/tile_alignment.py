@@ -0,0 +1,59 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Counts the native tiles decoded by PixelClassifier with and without
+snapping chunk_size to the tile grid.
+
+    python -m benchmarks.tile_alignment [--slide path] [--level 0]
+"""
+import time
+
+from clize import parameters, run
+
+from benchmarks.commons import ConstantModel, DecodeCounter, SyntheticSlide
+from slaid.classifiers.fixed_batch import PixelClassifier
+from slaid.commons.base import Slide, snap_chunk_to_tiles
+
+
+def _get_reader(slide_path: str):
+    if slide_path:
+        from slaid.commons.openslide import BasicSlide
+        return BasicSlide(slide_path)
+    return SyntheticSlide()
+
+
+def main(*,
+         slide: str = None,
+         level: int = 0,
+         chunk_size: (int, parameters.multi()) = None,
+         batch_size: int = 8192):
+    """
+    :param slide: slide to read, an in-memory synthetic slide with 256x256
+        tiles is used if not given
+    :param chunk_size: row band heights to try
+    """
+    chunk_sizes = chunk_size or [100, 300, 1000]
+    print(f'{"chunk":>6} {"aligned":>8} {"used":>6} {"reads":>6} '
+          f'{"decoded":>8} {"unique":>7} {"seconds":>8}')
+    for size in chunk_sizes:
+        for align_chunks in (False, True):
+            reader = DecodeCounter(_get_reader(slide))
+            classifier = PixelClassifier(ConstantModel(),
+                                         'benchmark',
+                                         chunk_size=size,
+                                         align_chunks=align_chunks)
+            start = time.perf_counter()
+            classifier.classify(Slide(reader),
+                                level=level,
+                                batch_size=batch_size)
+            elapsed = time.perf_counter() - start
+            tile_height = reader.level_tile_sizes[level][1]
+            used = snap_chunk_to_tiles(
+                (size, 1), (tile_height, 1))[0] if align_chunks else size
+            print(f'{size:>6} {str(align_chunks):>8} {used:>6} '
+                  f'{reader.reads:>6} {reader.decoded_tiles:>8} '
+                  f'{reader.unique_tiles:>7} {elapsed:>8.2f}')
+
+
+if __name__ == '__main__':
+    run(main)
@@ -6,7 +6,7 @@ import os
 import clize
 import pkg_resources
 
-from slaid.runners import fixed_batch
+from slaid.runners import cascade, fixed_batch, multi
 
 logging.basicConfig(format='%(asctime)s,%(msecs)d %(levelname)-8s '
                     '[%(filename)s:%(lineno)d] %(message)s',
@@ -30,4 +30,4 @@ if __name__ == '__main__':
                                                 f'resources/models/{model}')
         fixed_batch = set_model(fixed_batch, model)
 
-    clize.run({'fixed-batch': fixed_batch})
+    clize.run({'fixed-batch': fixed_batch, 'cascade': cascade, 'multi': multi})
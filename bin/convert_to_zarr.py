@@ -0,0 +1,43 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+import logging
+from importlib import import_module
+
+from clize import parameters, run
+
+from slaid.commons.zarr import write_slide
+
+logging.basicConfig(format='%(asctime)s,%(msecs)d %(levelname)-8s '
+                    '[%(filename)s:%(lineno)d] %(message)s',
+                    datefmt='%Y-%m-%d:%H:%M:%S',
+                    level=logging.INFO)
+
+
+def main(slide,
+         output,
+         *,
+         slide_reader: ('r', parameters.one_of('ecvl', 'openslide')) = 'ecvl',
+         tile_size: ('t', int) = 512,
+         level: ('l', int, parameters.multi()) = None,
+         workers: ('w', int) = None):
+    """
+    Converts a slide into a multiscale zarr pyramid, readable with
+    --slide-reader zarr.
+
+    :param slide: path to the slide
+    :param output: destination, .zarr or .zip
+    :param tile_size: chunk size of each level
+    :param level: levels to convert, all of them if not given
+    :param workers: threads used for reading and encoding tiles
+    """
+    basic_slide_cls = import_module(f'slaid.commons.{slide_reader}').BasicSlide
+    write_slide(basic_slide_cls(slide),
+                output,
+                tile_size=tile_size,
+                levels=level or None,
+                workers=workers)
+    print(output)
+
+
+if __name__ == '__main__':
+    run(main)
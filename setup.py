@@ -10,12 +10,17 @@ setuptools.setup(name="slaid",
                  version=get_version(),
                  description="AI for automatic analysis of slides",
                  long_description_content_type="text/markdown",
-                 packages=setuptools.find_packages(),
+                 packages=setuptools.find_packages(exclude=[
+                     'tests', 'tests.*', 'benchmarks', 'benchmarks.*'
+                 ]),
                  classifiers=[
                      "Programming Language :: Python :: 3",
                  ],
                  python_requires='>=3.6',
                  install_requires=reqs,
-                 scripts=['bin/classify.py', 'bin/annotate_onnx.py'],
+                 scripts=[
+                     'bin/classify.py', 'bin/annotate_onnx.py',
+                     'bin/convert_to_zarr.py'
+                 ],
                  package_data={'': ['resources/models/*']},
                  include_package_data=True)
@@ -0,0 +1,129 @@
+import hashlib
+import json
+import logging
+import os
+import shutil
+from functools import lru_cache
+
+from slaid.writers.zarr_io import ZarrStorage
+
+logger = logging.getLogger('result-cache')
+
+
+class ResultCache:
+    """
+    Classification results keyed by what they depend on: the slide, the
+    model file and the classification parameters.
+    Slide files are identified by a digest of their content, not by path
+    or modification time, so that copies of a slide share results; slides
+    stored as directories by the sizes and modification times of their
+    files.
+    Outputs are tagged with the key of their result, so jobs already done
+    are skipped; with cache_dir, results are also copied there and
+    restored from there into the outputs of other runs.
+    """
+    KEY_ATTR = 'cache_key'
+
+    def __init__(self, cache_dir: str = None):
+        self.cache_dir = cache_dir
+
+    @staticmethod
+    def get_key(slide_path: str, model_path: str, **params) -> str:
+        digest = hashlib.sha1()
+        digest.update(fingerprint(slide_path).encode())
+        digest.update(file_digest(model_path).encode())
+        digest.update(json.dumps(params, sort_keys=True).encode())
+        return digest.hexdigest()
+
+    def restore(self, key: str, name: str, output_path: str,
+                slide_path: str) -> bool:
+        """
+        Returns whether the array name of output_path holds the result of
+        key for slide_path, copying it from cache_dir if needed. The output
+        is opened for writing only to copy the result.
+        """
+        if os.path.exists(output_path) and ZarrStorage(
+                name, output_path, mode='r').get_array_metadata().get(
+                    self.KEY_ATTR) == key:
+            logger.info('result %s already in output', key)
+            return True
+        path = self.get_path(key)
+        if path is None or not os.path.exists(path):
+            return False
+        logger.info('restoring result %s from %s', key, path)
+        storage = ZarrStorage(name, output_path)
+        storage.copy(ZarrStorage(name, path, mode='r'))
+        storage.add_metadata({'filename': slide_path})
+        return True
+
+    def store(self, key: str, storage: ZarrStorage):
+        storage.add_array_metadata({self.KEY_ATTR: key})
+        path = self.get_path(key)
+        if path is None or os.path.exists(path):
+            return
+        logger.info('storing result %s in %s', key, path)
+        os.makedirs(self.cache_dir, exist_ok=True)
+        tmp_path = f'{path[:-len(".zarr")]}.{os.getpid()}.tmp.zarr'
+        ZarrStorage(storage.name, tmp_path).copy(storage)
+        try:
+            os.rename(tmp_path, path)
+        except OSError:
+            # stored meanwhile by a concurrent run
+            shutil.rmtree(tmp_path)
+
+    def get_path(self, key: str) -> str:
+        if self.cache_dir is None:
+            return None
+        return os.path.join(self.cache_dir, f'{key}.zarr')
+
+
+def fingerprint(path: str) -> str:
+    """
+    Identifies the content of a file by its digest (see file_digest), and
+    the content of a directory (e.g. zarr slides or mrxs data) by the
+    relative paths, sizes and modification times of its files, which are
+    too many to be read.
+    """
+    digest = hashlib.sha1()
+    if os.path.isdir(path):
+        for root, dirs, files in os.walk(path):
+            dirs.sort()
+            for name in sorted(files):
+                file_path = os.path.join(root, name)
+                stat = os.stat(file_path)
+                digest.update(f'{os.path.relpath(file_path, path)}:'
+                              f'{stat.st_size}:{stat.st_mtime_ns};'.encode())
+        return digest.hexdigest()
+
+    digest.update(file_digest(path).encode())
+    # mrxs slides keep their data in a directory named after the file
+    data_dir = os.path.splitext(path)[0]
+    if os.path.isdir(data_dir):
+        digest.update(fingerprint(data_dir).encode())
+    return digest.hexdigest()
+
+
+def array_fingerprint(path: str, name: str) -> str:
+    """
+    Identifies the content of the array name of the zarr group in path,
+    e.g. a filter mask, regardless of the other arrays of the group.
+    """
+    return ZarrStorage(name, path, mode='r')._root[name].digest().hex()
+
+
+def file_digest(path: str) -> str:
+    """
+    Returns the digest of the content of path, computed once per process
+    while its size and modification time do not change.
+    """
+    stat = os.stat(path)
+    return _file_digest(os.path.abspath(path), stat.st_size, stat.st_mtime_ns)
+
+
+@lru_cache(maxsize=None)
+def _file_digest(path: str, size: int, mtime: int) -> str:
+    digest = hashlib.sha1()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(2**20), b''):
+            digest.update(block)
+    return digest.hexdigest()
@@ -8,7 +8,8 @@ from progress.bar import Bar
 from slaid.commons import Filter, Mask, Slide
 from slaid.commons.base import ImageInfo
 from slaid.models import Model
-from slaid.commons.base import ArrayFactory, NumpyArrayFactory
+from slaid.commons.base import (ArrayFactory, NumpyArrayFactory,
+                                snap_chunk_to_tiles)
 
 logger = logging.getLogger('classify')
 fh = logging.FileHandler('/tmp/base-classifier.log')
@@ -81,7 +82,9 @@ class Classifier(abc.ABC):
     def _predict(self, array):
         if array.size == 0:
             return np.empty((0, ))
-        return self.model.predict(array)
+        # slide arrays may be strided views on the reader buffer,
+        # this is where they are materialised
+        return self.model.predict(np.ascontiguousarray(array))
 
 
 class BasicClassifier(Classifier):
@@ -91,10 +94,12 @@ class BasicClassifier(Classifier):
                  feature: str,
                  array_factory: ArrayFactory = None,
                  _filter: Filter = None,
-                 chunk: Tuple[int, int] = None):
+                 chunk: Tuple[int, int] = None,
+                 align_chunks: bool = False):
         super().__init__(model, feature, array_factory)
         self.chunk = chunk
         self._filter = _filter
+        self.align_chunks = align_chunks
 
     def set_filter(self, _filter: Filter):
         self._filter = _filter
@@ -107,6 +112,9 @@ class BasicClassifier(Classifier):
 
         slide_array = slide[level]
         chunk = self.chunk or slide_array.size
+        if self.align_chunks:
+            chunk = snap_chunk_to_tiles(chunk, slide_array.tile_size,
+                                        self._patch_size or (1, 1))
         dtype = 'uint8' if threshold or round_to_0_100 else 'float32'
 
         if self._patch_size:
@@ -120,56 +128,54 @@ class BasicClassifier(Classifier):
 
     def _classify_pixels(self, slide_array, chunk, threshold, round_to_0_100,
                          dtype):
+        _filter = None
         if self._filter:
             if (self._filter.array == 0).all():
                 return self.array_factory.zeros(slide_array.size, dtype=dtype)
 
             self._filter.rescale(slide_array.size)
             _filter = self._filter.array
-        else:
-            _filter = np.ones(slide_array.size, dtype='bool')
-
-        predictions = self.array_factory.empty((0, slide_array.size[1]),
-                                               dtype=dtype)
-        with Bar('Processing', max=_filter.shape[0] // chunk[0] or 1) as bar:
-            for x in range(0, _filter.shape[0], chunk[0]):
-                row = np.empty((min(chunk[0], _filter.shape[0] - x), 0),
-                               dtype=dtype)
-                for y in range(0, _filter.shape[1], chunk[1]):
-                    filter_block = _filter[x:x + chunk[0], y:y + chunk[1]]
 
-                    res = np.zeros(filter_block.shape, dtype='float32')
-                    if (filter_block == True).any():
-                        block = slide_array[x:x + chunk[0],
-                                            y:y + chunk[1]].convert(
-                                                self.model.image_info)
-                        to_predict = block[filter_block]
-                        prediction = self._predict(to_predict.array)
-                        res[filter_block] = prediction
+        channel_first = self.model.image_info.channel == ImageInfo.Channel.FIRST
+        predictions = self.array_factory.zeros(slide_array.size, dtype=dtype)
+        with Bar('Processing', max=slide_array.size[0] // chunk[0]
+                 or 1) as bar:
+            for x in range(0, slide_array.size[0], chunk[0]):
+                for y in range(0, slide_array.size[1], chunk[1]):
+                    block_size = (min(chunk[0], slide_array.size[0] - x),
+                                  min(chunk[1], slide_array.size[1] - y))
+                    if _filter is not None:
+                        filter_block = _filter[x:x + chunk[0], y:y + chunk[1]]
+                        if not filter_block.any():
+                            continue
+
+                    block = slide_array[x:x + chunk[0],
+                                        y:y + chunk[1]].convert(
+                                            self.model.image_info).array
+                    if _filter is None:
+                        res = np.empty(block_size, dtype='float32')
+                        to_predict = block.reshape(
+                            3, -1) if channel_first else block.reshape(-1, 3)
+                        res[...] = self._predict(to_predict).reshape(
+                            block_size)
+                    else:
+                        res = np.zeros(block_size, dtype='float32')
+                        to_predict = block[:, filter_block] if channel_first \
+                            else block[filter_block]
+                        res[filter_block] = self._predict(to_predict)
                     res = self._threshold(res, threshold)
                     res = self._round_to_0_100(res, round_to_0_100)
-                    row = self._append(row, res, 1)
-                predictions = self._append(predictions, row, 0)
+                    predictions[x:x + block_size[0], y:y + block_size[1]] = res
                 bar.next()
 
         return predictions
 
-
-#
-
-    @staticmethod
-    def _append(array, values, axis):
-        import zarr
-        if isinstance(array, np.ndarray):
-            return np.append(array, values, axis)
-        elif isinstance(array, zarr.core.Array):
-            array.append(values, axis)
-            return array
-
     def _classify_patches(self, slide_array, chunk, threshold, round_to_0_100,
                           dtype):
-        predictions = self.array_factory.empty(
-            (0, slide_array.size[1] // self._patch_size[1]), dtype=dtype)
+        predictions = self.array_factory.zeros(
+            (slide_array.size[0] // self._patch_size[0],
+             slide_array.size[1] // self._patch_size[1]),
+            dtype=dtype)
         _filter = self._filter if self._filter else np.ones(
             (slide_array.size[0] // self._patch_size[0],
              slide_array.size[1] // self._patch_size[1]),
@@ -187,8 +193,6 @@ class BasicClassifier(Classifier):
                 row_size = row_size - (row_size % self._patch_size[0])
                 if not row_size:
                     break
-                row = np.empty((row_size // self._patch_size[0], 0),
-                               dtype=dtype)
 
                 for y in range(0, slide_array.size[1], chunk[1]):
                     col_size = min(chunk[1], slide_array.size[1] - y)
@@ -196,44 +200,26 @@ class BasicClassifier(Classifier):
                     if not col_size:
                         break
 
-                    filter_block = _filter[
-                        x // self._patch_size[0]:(x + row_size) //
-                        self._patch_size[0],
-                        y // self._patch_size[1]:(y + col_size) //
-                        self._patch_size[1]]
-                    res = np.zeros(filter_block.shape, dtype='float32')
+                    patch_x = slice(x // self._patch_size[0],
+                                    (x + row_size) // self._patch_size[0])
+                    patch_y = slice(y // self._patch_size[1],
+                                    (y + col_size) // self._patch_size[1])
+                    filter_block = np.asarray(_filter[patch_x, patch_y],
+                                              dtype='bool')
+                    if not filter_block.any():
+                        continue
 
-                    if (filter_block == True).any():
-                        chunked_array = slide_array[x:x + row_size,
-                                                    y:y + col_size].convert(
-                                                        self.model.image_info)
-                        patches, channel_first = chunked_array.get_blocks(
-                            self._patch_size)
-                        to_predict = patches[:, filter_block,
-                                             ...] if channel_first else patches[
-                                                 filter_block, :, ...]
-                        to_predict = to_predict.reshape(
-                            (to_predict.shape[0] * to_predict.shape[1], ) +
-                            to_predict.shape[2:])
-                        if to_predict.shape[0] > 0:
-                            prediction = self._predict(to_predict)
-                            res[filter_block] = prediction
-                            res = self._threshold(res, threshold)
-                            res = self._round_to_0_100(res, round_to_0_100)
-
-                    row = self._append(row, res, 1)
-                predictions = self._append(predictions, row, 0)
+                    res = np.zeros(filter_block.shape, dtype='float32')
+                    patches = slide_array[
+                        x:x + row_size, y:y + col_size].convert(
+                            self.model.image_info).get_blocks(self._patch_size)
+                    # the whole chunk goes to the model in a single batch
+                    res[filter_block] = self._predict(patches[filter_block])
+                    res = self._threshold(res, threshold)
+                    res = self._round_to_0_100(res, round_to_0_100)
+                    predictions[patch_x, patch_y] = res
                 progress_bar.next()
         return predictions
 
     def _get_slide_array(self, slide, level):
         return slide[level].convert(self.model.image_info)
-
-
-def append_array(array, values, axis):
-    import zarr
-    if isinstance(array, np.ndarray):
-        return np.append(array, values, axis)
-    elif isinstance(array, zarr.core.Array):
-        array.append(values, axis)
-        return array
@@ -1,54 +1,167 @@
+import json
 import logging
-from dataclasses import dataclass
+import math
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, replace
 from datetime import datetime as dt
 from functools import partial
-from typing import Tuple, Union
+from typing import Callable, Dict, List, Tuple, Union
 
 import numpy as np
 
 from slaid.classifiers.base import Classifier as BaseClassifier
-from slaid.classifiers.base import append_array
+from slaid.classifiers.pipeline import Pipeline
+from slaid.classifiers.tuner import BatchSizeTuner, get_batch_size
 from slaid.commons import Filter, Mask
-from slaid.commons.base import ArrayFactory, ImageInfo, Slide
+from slaid.commons.base import (ArrayFactory, ImageInfo, Journal, Slide,
+                                SlideArray, coalesce_cells,
+                                snap_chunk_to_tiles)
 from slaid.models import Model
 
 logger = logging.getLogger()
 
+DEFAULT_MAX_READ_SIZE = 2048
+
 
 @dataclass
 class BatchIterator:
+    """
+    Accumulates items (rows of 3 values, or columns when channel_first)
+    and returns them by batches of batch_size.
+    Items are kept in a preallocated buffer that grows by doubling, the
+    items left over by iter are moved to its head in place.
+    Batches are views on the buffer, valid until the next append.
+    """
     batch_size: int
     channel_first: bool
 
     def __post_init__(self):
-        self._buffer: np.ndarray = np.empty((3,
-                                             0) if self.channel_first else (0,
-                                                                            3))
+        self._buffer: np.ndarray = None
+        self._start = 0
+        self._stop = 0
 
     @property
     def buffer(self):
-        return self._buffer
+        if self._buffer is None:
+            return np.empty((3, 0) if self.channel_first else (0, 3))
+        return self._get_items(self._start, self._stop)
 
     def iter(self) -> np.ndarray:
-        max_index = self._buffer_size() - self._buffer_size() % self.batch_size
-        for i in range(0, max_index, self.batch_size):
-            batch = self._buffer[:, i:i + self.
-                                 batch_size] if self.channel_first else self._buffer[
-                                     i:i + self.batch_size, :]
+        while self._stop - self._start >= self.batch_size:
+            batch = self._get_items(self._start, self._start + self.batch_size)
+            self._start += self.batch_size
             yield batch
-        self._buffer = self._buffer[:,
-                                    max_index:] if self.channel_first else self._buffer[
-                                        max_index:, :]
+
+    def clear(self):
+        self._start = self._stop = 0
 
     def append(self, array: np.ndarray):
-        self._buffer = np.concatenate([self._buffer, array])
+        size = array.shape[1] if self.channel_first else array.shape[0]
+        if self._buffer is None:
+            self._buffer = self._allocate(max(size, self.batch_size),
+                                          array.dtype)
+        dtype = np.result_type(self._buffer.dtype, array.dtype)
+        if self._stop + size > self._capacity() or dtype != self._buffer.dtype:
+            self._make_room(size, dtype)
+
+        if self.channel_first:
+            self._buffer[:, self._stop:self._stop + size] = array
+        else:
+            self._buffer[self._stop:self._stop + size] = array
+        self._stop += size
+
+    def _make_room(self, size: int, dtype: np.dtype):
+        remaining = self._stop - self._start
+        capacity = self._capacity()
+        if remaining + size > capacity or dtype != self._buffer.dtype:
+            while remaining + size > capacity:
+                capacity *= 2
+            buffer = self._allocate(capacity, dtype)
+        else:
+            buffer = self._buffer
+
+        if self.channel_first:
+            buffer[:, :remaining] = self._buffer[:, self._start:self._stop]
+        else:
+            buffer[:remaining] = self._buffer[self._start:self._stop]
+        self._buffer = buffer
+        self._start, self._stop = 0, remaining
+
+    def _allocate(self, capacity: int, dtype: np.dtype) -> np.ndarray:
+        return np.empty((3, capacity) if self.channel_first else (capacity, 3),
+                        dtype=dtype)
 
-    def _buffer_size(self):
+    def _capacity(self) -> int:
         return self._buffer.shape[
             1] if self.channel_first else self._buffer.shape[0]
 
+    def _get_items(self, start: int, stop: int) -> np.ndarray:
+        return self._buffer[:, start:stop] if self.channel_first else \
+            self._buffer[start:stop]
+
 
 class Classifier(BaseClassifier):
+    """
+    batch_size may also be a BatchSizeTuner: its size is then read for
+    each batch, and each prediction is timed to tune it.
+    run_key identifies what the output depends on besides the classify
+    arguments, e.g. the model file.
+    """
+    dedup = False
+    run_key: str = None
+    _tuner: BatchSizeTuner = None
+
+    def _set_tuner(self, batch_size: Union[int, BatchSizeTuner]):
+        self._tuner = batch_size if isinstance(batch_size,
+                                               BatchSizeTuner) else None
+
+    def _predict(self, array):
+        start = time.perf_counter()
+        if self.dedup and array.size:
+            predictions = self._predict_unique(array)
+        else:
+            predictions = super()._predict(array)
+        if self._tuner is not None:
+            self._tuner.update(len(predictions), array.nbytes,
+                               time.perf_counter() - start)
+        return predictions
+
+    @property
+    def _input_image_info(self) -> ImageInfo:
+        """
+        ImageInfo the slide pixels are converted to before batching. With
+        dedup pixels stay in the 0_255 range, and only the distinct colours
+        are converted to the range of the model.
+        """
+        image_info = self.model.image_info
+        if self.dedup and image_info.pixel_range != ImageInfo.Range._0_255:
+            return replace(image_info, pixel_range=ImageInfo.Range._0_255)
+        return image_info
+
+    def _predict_unique(self, array: np.ndarray) -> np.ndarray:
+        """
+        Predicts each distinct colour of a batch of pixels once and maps
+        the predictions back. uint8 pixels are packed in 24-bit keys.
+        """
+        channel_first = self.model.image_info.channel == ImageInfo.Channel.FIRST
+        if array.dtype == np.uint8:
+            channels = array if channel_first else array.T
+            keys = (channels[0].astype('uint32') << 16) | (
+                channels[1].astype('uint32') << 8) | channels[2]
+            keys, inverse = np.unique(keys, return_inverse=True)
+            colours = np.stack([(keys >> 16) & 255,
+                                (keys >> 8) & 255, keys & 255],
+                               axis=0 if channel_first else 1).astype('uint8')
+        else:
+            colours, inverse = np.unique(array,
+                                         axis=1 if channel_first else 0,
+                                         return_inverse=True)
+        colours = self._input_image_info.convert(colours,
+                                                 self.model.image_info)
+        predictions = super()._predict(colours)
+        return predictions[inverse.reshape(-1)]
 
     def _predict_by_batch(self, batch_iterator: BatchIterator,
                           all_buffer: bool) -> np.ndarray:
@@ -56,34 +169,128 @@ class Classifier(BaseClassifier):
         predictions = []
         for batch in batch_iterator.iter():
             predictions.append(self._predict(batch))
+            if self._tuner is not None:
+                batch_iterator.batch_size = self._tuner.batch_size
 
         if all_buffer:
             predictions.append(self._predict(batch_iterator.buffer))
+            batch_iterator.clear()
         predictions = np.concatenate(predictions) if predictions else np.empty(
             (0, ))
         return predictions
 
+    def _predict_in_batches(self, array: np.ndarray,
+                            batch_size: Union[int, BatchSizeTuner],
+                            channel_first: bool) -> np.ndarray:
+        size = array.shape[1] if channel_first else array.shape[0]
+        predictions, start = [], 0
+        while start < size:
+            stop = start + get_batch_size(batch_size)
+            predictions.append(
+                self._predict(
+                    array[:,
+                          start:stop] if channel_first else array[start:stop]))
+            start = stop
+        return np.concatenate(predictions) if predictions else np.empty((0, ))
+
+
+def _scatter(array, coords: np.ndarray, values: np.ndarray):
+    if isinstance(array, np.ndarray):
+        array[coords[:, 0], coords[:, 1]] = values
+    else:
+        array.vindex[coords[:, 0], coords[:, 1]] = values
+
 
 class FilteredClassifier(Classifier):
+    """
+    Classifies the cells of the slide selected by the filter.
+    Adjacent selected cells are coalesced into rectangles of at most
+    max_read_size pixels per side, each read from the slide at once, and
+    rectangles are grouped up to batch_size items per prediction round.
+    """
 
     def __init__(self,
                  model: "Model",
                  feature: str,
                  _filter: Filter,
-                 array_factory: ArrayFactory = None):
+                 array_factory: ArrayFactory = None,
+                 pipeline: Pipeline = None,
+                 max_read_size: int = DEFAULT_MAX_READ_SIZE):
         super().__init__(model, feature, array_factory)
         self._filter = _filter
+        self.pipeline = pipeline
+        self.max_read_size = max_read_size
+
+    def _get_rects(self, filter_array: np.ndarray,
+                   cell_size: Tuple[int, int]) -> np.ndarray:
+        return coalesce_cells(filter_array,
+                              (max(1, self.max_read_size // cell_size[0]),
+                               max(1, self.max_read_size // cell_size[1])))
+
+    @staticmethod
+    def _group_rects(rects: np.ndarray, cell_items: int,
+                     batch_size: Union[int, BatchSizeTuner]):
+        group, items = [], 0
+        for rect in rects:
+            rect_items = rect[2] * rect[3] * cell_items
+            if group and items + rect_items > get_batch_size(batch_size):
+                yield group
+                group, items = [], 0
+            group.append(rect)
+            items += rect_items
+        if group:
+            yield group
+
+    @staticmethod
+    def _read_rects(slide_array, rects: List[np.ndarray],
+                    cell_size: Tuple[int, int]):
+        return rects, [
+            slide_array[row * cell_size[0]:(row + n_rows) * cell_size[0],
+                        col * cell_size[1]:(col + n_cols) * cell_size[1]]
+            for row, col, n_rows, n_cols in rects
+        ]
+
+    def _run(self, groups, read: Callable, convert: Callable,
+             predict: Callable, write: Callable):
+        if self.pipeline:
+            self.pipeline.run(groups, read, convert, predict, write)
+        else:
+            for group in groups:
+                write(predict(convert(read(group))))
 
 
 class PixelClassifier(Classifier):
+    """
+    Classifies the slide by row bands of chunk_size rows.
+    With read_ahead > 0, up to read_ahead upcoming row bands are read and
+    converted by read_workers threads while the current one is predicted.
+    With align_chunks, chunk_size is snapped to the native tile grid of
+    the slide level.
+    With a pipeline, row bands are read, converted, predicted and written
+    by its stages concurrently instead.
+    With dedup, only the distinct colours of each batch are predicted.
+    Written rows are recorded in the journal of the array factory: row
+    bands already completed by a previous run on the same output, with the
+    same run key, model and parameters, are skipped.
+    """
 
     def __init__(self,
                  model: "Model",
                  feature: str,
                  array_factory: ArrayFactory = None,
-                 chunk_size: int = None):
+                 chunk_size: int = None,
+                 read_ahead: int = 0,
+                 read_workers: int = None,
+                 align_chunks: bool = False,
+                 pipeline: Pipeline = None,
+                 dedup: bool = False):
         super().__init__(model, feature, array_factory)
         self.chunk_size = chunk_size
+        self.read_ahead = read_ahead
+        self.read_workers = read_workers
+        self.align_chunks = align_chunks
+        self.pipeline = pipeline
+        self.dedup = dedup
 
     def classify(self,
                  slide: Slide,
@@ -92,35 +299,140 @@ class PixelClassifier(Classifier):
                  batch_size: int = 8,
                  round_to_0_100: bool = True) -> Mask:
 
+        self._set_tuner(batch_size)
         slide_array = slide[level]
-        row_size = self.chunk_size if self.chunk_size else slide_array.size[0]
+        row_size = self._get_row_size(slide_array)
         dtype = 'uint8' if threshold or round_to_0_100 else 'float32'
 
-        res = self.array_factory.empty(slide_array.size, dtype=dtype)
+        res, journal = self.array_factory.resume(
+            slide_array.size, dtype,
+            self._get_run_key(level, threshold, round_to_0_100))
+        row_indexes = [
+            row_idx for row_idx in range(0, slide_array.size[0], row_size)
+            if not journal.is_done(row_idx, row_idx + row_size)
+        ]
+        if len(row_indexes) < math.ceil(slide_array.size[0] / row_size):
+            logger.info('resuming %s: %s row bands left', self.label,
+                        len(row_indexes))
 
         channel_first = self.model.image_info.channel == ImageInfo.Channel.FIRST
-        batch_iterator = BatchIterator(batch_size, channel_first)
+        if self.pipeline:
+            self._classify_with_pipeline(slide_array, res, journal,
+                                         row_indexes, row_size, channel_first,
+                                         threshold, batch_size, round_to_0_100)
+            return self._get_mask(slide, res, level,
+                                  slide.level_downsamples[level],
+                                  round_to_0_100)
+
+        batch_iterator = BatchIterator(get_batch_size(batch_size),
+                                       channel_first)
         row_splitter = RowSplitter(slide_array.size[1])
 
-        for row_idx in range(0, slide_array.size[0], row_size):
-            row = slide_array[row_idx:row_idx + row_size, :].convert(
-                self.model.image_info).array
-            row = row.reshape(3, -1) if channel_first else row.reshape(-1, 3)
-
-            batch_iterator.append(row)
-            predictions = self._predict_by_batch(batch_iterator, False)
-            row_splitter.append(predictions)
-            self._set_rows(res, row_splitter, threshold, round_to_0_100)
-
-        remaining_predictions = self._predict_by_batch(batch_iterator, True)
-        row_splitter.append(remaining_predictions)
-        self._set_rows(res, row_splitter, threshold, round_to_0_100)
+        # predictions are contiguous only within runs of consecutive bands
+        for run in self._get_runs(row_indexes, row_size):
+            row_splitter.seek(run[0])
+            for row in self._read_rows(slide_array, row_size, channel_first,
+                                       run):
+                batch_iterator.append(row)
+                predictions = self._predict_by_batch(batch_iterator, False)
+                row_splitter.append(predictions)
+                self._set_rows(res, journal, row_splitter, threshold,
+                               round_to_0_100)
+
+            remaining_predictions = self._predict_by_batch(
+                batch_iterator, True)
+            row_splitter.append(remaining_predictions)
+            self._set_rows(res, journal, row_splitter, threshold,
+                           round_to_0_100)
 
         return self._get_mask(slide, res, level,
                               slide.level_downsamples[level], round_to_0_100)
 
-    def _set_rows(self, array, row_splitter: "RowSplitter", threshold: float,
-                  round_to_0_100: bool):
+    def _get_run_key(self, level: int, threshold: float,
+                     round_to_0_100: bool) -> str:
+        return json.dumps(
+            [self.run_key,
+             str(self.model), level, threshold, round_to_0_100])
+
+    def _get_row_size(self, slide_array) -> int:
+        row_size = self.chunk_size if self.chunk_size else slide_array.size[0]
+        if self.align_chunks:
+            row_size = snap_chunk_to_tiles((row_size, slide_array.size[1]),
+                                           slide_array.tile_size)[0]
+        return row_size
+
+    @staticmethod
+    def _get_runs(row_indexes: List[int], row_size: int) -> List[List[int]]:
+        runs = []
+        for row_idx in row_indexes:
+            if runs and runs[-1][-1] + row_size == row_idx:
+                runs[-1].append(row_idx)
+            else:
+                runs.append([row_idx])
+        return runs
+
+    def _read_rows(self, slide_array, row_size: int, channel_first: bool,
+                   row_indexes: List[int]):
+        read_row = partial(self._read_row, slide_array, row_size,
+                           channel_first)
+        if not self.read_ahead:
+            yield from map(read_row, row_indexes)
+            return
+
+        with ThreadPoolExecutor(self.read_workers
+                                or self.read_ahead) as executor:
+            pending = deque()
+            for row_idx in row_indexes:
+                pending.append(executor.submit(read_row, row_idx))
+                if len(pending) > self.read_ahead:
+                    yield pending.popleft().result()
+            while pending:
+                yield pending.popleft().result()
+
+    def _read_row(self, slide_array, row_size: int, channel_first: bool,
+                  row_idx: int) -> np.ndarray:
+        return self._convert_row(slide_array[row_idx:row_idx + row_size, :],
+                                 channel_first)
+
+    def _convert_row(self, row, channel_first: bool) -> np.ndarray:
+        row = row.convert(self._input_image_info).array
+        return row.reshape(3, -1) if channel_first else row.reshape(-1, 3)
+
+    def _classify_with_pipeline(self, slide_array, res, journal: Journal,
+                                row_indexes: List[int], row_size: int,
+                                channel_first: bool, threshold: float,
+                                batch_size: int, round_to_0_100: bool):
+
+        def read(row_idx):
+            return row_idx, slide_array[row_idx:row_idx + row_size, :]
+
+        def convert(item):
+            row_idx, row = item
+            return row_idx, self._convert_row(row, channel_first)
+
+        def predict(item):
+            row_idx, row = item
+            return row_idx, self._predict_in_batches(row, batch_size,
+                                                     channel_first)
+
+        def write(item):
+            row_idx, predictions = item
+            self._write_rows(res, journal, row_idx, predictions, threshold,
+                             round_to_0_100)
+
+        self.pipeline.run(row_indexes, read, convert, predict, write)
+
+    def _write_rows(self, res, journal: Journal, row_idx: int,
+                    predictions: np.ndarray, threshold: float,
+                    round_to_0_100: bool):
+        rows = predictions.reshape(-1, res.shape[1])
+        rows = self._threshold(rows, threshold)
+        rows = self._round_to_0_100(rows, round_to_0_100)
+        res[row_idx:row_idx + rows.shape[0], :] = rows
+        journal.set_done(row_idx, row_idx + rows.shape[0])
+
+    def _set_rows(self, array, journal: Journal, row_splitter: "RowSplitter",
+                  threshold: float, round_to_0_100: bool):
         try:
             row_index, rows = row_splitter.split()
         except RowSplitter.RowsNotFound:
@@ -129,9 +441,123 @@ class PixelClassifier(Classifier):
             rows = self._threshold(rows, threshold)
             rows = self._round_to_0_100(rows, round_to_0_100)
             array[row_index:row_index + rows.shape[0], :] = rows
+            journal.set_done(row_index, row_index + rows.shape[0])
+
+
+class MultiPixelClassifier:
+    """
+    Classifies the slide with the pixel models of several PixelClassifier
+    in a single pass: each row band is read once, converted once per
+    distinct image info of the models and predicted by every model.
+    Each classifier writes its mask with its own array factory (e.g. the
+    arrays of the same zarr group) and keeps its journal; bands completed
+    by all the classifiers are not read.
+    Row bands are split as by the first classifier.
+    """
+
+    def __init__(self,
+                 classifiers: List[PixelClassifier],
+                 pipeline: Pipeline = None):
+        labels = [classifier.label for classifier in classifiers]
+        if not labels or len(set(labels)) != len(labels):
+            raise ValueError(f'invalid labels {labels}')
+        for classifier in classifiers:
+            if classifier.model.patch_size:
+                raise ValueError(f'{classifier.model} is not a pixel model')
+        self.classifiers = classifiers
+        self.pipeline = pipeline
+
+    def classify(self,
+                 slide: Slide,
+                 level: int,
+                 threshold: float = None,
+                 batch_size: Union[int, BatchSizeTuner, Dict[str, int]] = 8,
+                 round_to_0_100: bool = True) -> Dict[str, Mask]:
+        """
+        batch_size is shared, or given per label.
+        """
+        slide_array = slide[level]
+        row_size = self.classifiers[0]._get_row_size(slide_array)
+        dtype = 'uint8' if threshold or round_to_0_100 else 'float32'
+
+        outputs, batch_sizes = {}, {}
+        for classifier in self.classifiers:
+            batch_sizes[
+                classifier.label] = batch_size[classifier.label] if isinstance(
+                    batch_size, dict) else batch_size
+            classifier._set_tuner(batch_sizes[classifier.label])
+            outputs[classifier.label] = classifier.array_factory.resume(
+                slide_array.size, dtype,
+                classifier._get_run_key(level, threshold, round_to_0_100))
+
+        bands = {}
+        for row_idx in range(0, slide_array.size[0], row_size):
+            pending = [
+                classifier for classifier in self.classifiers
+                if not outputs[classifier.label][1].is_done(
+                    row_idx, row_idx + row_size)
+            ]
+            if pending:
+                bands[row_idx] = pending
+
+        def read(row_idx):
+            return row_idx, slide_array[row_idx:row_idx + row_size, :]
+
+        def convert(item):
+            row_idx, row = item
+            rows = {}
+            for classifier in bands[row_idx]:
+                key = classifier._input_image_info._key()
+                if key not in rows:
+                    rows[key] = classifier._convert_row(
+                        row, _is_channel_first(classifier))
+            return row_idx, rows
+
+        def predict(item):
+            row_idx, rows = item
+            return row_idx, {
+                classifier.label:
+                classifier._predict_in_batches(
+                    rows[classifier._input_image_info._key()],
+                    batch_sizes[classifier.label],
+                    _is_channel_first(classifier))
+                for classifier in bands[row_idx]
+            }
+
+        def write(item):
+            row_idx, predictions = item
+            for classifier in bands[row_idx]:
+                res, journal = outputs[classifier.label]
+                classifier._write_rows(res, journal, row_idx,
+                                       predictions[classifier.label],
+                                       threshold, round_to_0_100)
+
+        if self.pipeline:
+            self.pipeline.run(list(bands), read, convert, predict, write)
+        else:
+            for row_idx in bands:
+                write(predict(convert(read(row_idx))))
+
+        return {
+            classifier.label:
+            classifier._get_mask(slide, outputs[classifier.label][0], level,
+                                 slide.level_downsamples[level],
+                                 round_to_0_100)
+            for classifier in self.classifiers
+        }
+
+
+def _is_channel_first(classifier: Classifier) -> bool:
+    return classifier.model.image_info.channel == ImageInfo.Channel.FIRST
 
 
 class FilteredPatchClassifier(FilteredClassifier):
+    """
+    Classifies the patches selected by the filter. Patches are split from
+    the coalesced reads without copying, and gathered into a buffer reused
+    across batches (unless a pipeline is used), so memory depends on
+    batch_size and max_read_size only.
+    """
 
     def classify(self,
                  slide: Slide,
@@ -142,41 +568,42 @@ class FilteredPatchClassifier(FilteredClassifier):
         if not self._patch_size:
             raise RuntimeError(f'invalid patch size {self._patch_size}')
 
+        self._set_tuner(batch_size)
         slide_array = slide[level]
+        rects = self._get_rects(self._get_filter(slide_array),
+                                self._patch_size)
 
-        filter_array = self._filter.array
-        patch_coords = np.argwhere(filter_array) * self._patch_size
-        patch_coords = list(
-            filter(partial(self._remove_borders, slide_array),
-                   iter(patch_coords)))
-
-        n_patches = len(patch_coords)
         dtype = 'uint8' if threshold or round_to_0_100 else 'float32'
         res = self.array_factory.zeros(
             (slide_array.size[0] // self._patch_size[0],
              slide_array.size[1] // self._patch_size[1]),
             dtype=dtype)
 
-        predictions = np.empty(n_patches)
-        patches = []
-        for patch_coord in patch_coords:
-            x, y = patch_coord
+        buffer = None
 
-            patch = slide_array[x:x + self._patch_size[0],
-                                y:y + self._patch_size[1]].convert(
-                                    self.model.image_info).array
-            patches.append(patch)
+        def read(rects):
+            return self._read_rects(slide_array, rects, self._patch_size)
 
-        for index in range(0, n_patches, batch_size):
+        def convert(item):
+            nonlocal buffer
+            coords, patches = self._convert_patches(
+                *item, out=None if self.pipeline else buffer)
+            if not self.pipeline:
+                buffer = patches
+            return coords, patches[:len(coords)]
 
-            to_predict = np.array(patches[index:index + batch_size])
-            prediction = self._predict(to_predict)
-            predictions[index:index + batch_size] = prediction
+        def predict(item):
+            coords, patches = item
+            return coords, self._predict_in_batches(patches, batch_size, False)
 
-        predictions = self._threshold(predictions, threshold)
-        predictions = self._round_to_0_100(predictions, round_to_0_100)
-        res.set_mask_selection(filter_array, predictions)
+        def write(item):
+            coords, predictions = item
+            predictions = self._threshold(predictions, threshold)
+            predictions = self._round_to_0_100(predictions, round_to_0_100)
+            _scatter(res, coords, predictions)
 
+        self._run(self._group_rects(rects, 1, batch_size), read, convert,
+                  predict, write)
         return self._get_mask(slide,
                               res,
                               level,
@@ -184,14 +611,59 @@ class FilteredPatchClassifier(FilteredClassifier):
                               round_to_0_100,
                               tile_size=self._patch_size[0])
 
-    def _remove_borders(self, slide_array: np.ndarray,
-                        coord: np.ndarray) -> bool:
-        return coord[0] <= (slide_array.size[0] -
-                            self._patch_size[0]) and coord[1] <= (
-                                slide_array.size[1] - self._patch_size[1])
+    def _get_filter(self, slide_array) -> np.ndarray:
+        """
+        Crops the filter to the patches fully inside the slide.
+        """
+        filter_array = np.asarray(self._filter.array)
+        return filter_array[:slide_array.size[0] //
+                            self._patch_size[0], :slide_array.size[1] //
+                            self._patch_size[1]]
+
+    def _convert_patches(
+            self,
+            rects: List[np.ndarray],
+            regions: List[SlideArray],
+            out: np.ndarray = None) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Splits the regions read for rects into patches, gathered in out
+        (allocated if missing or too small). Returns the filter
+        coordinates of the patches and out.
+        """
+        n_patches = sum(rect[2] * rect[3] for rect in rects)
+        coords, offset = [], 0
+        for (row, col, n_rows, n_cols), region in zip(rects, regions):
+            blocks = region.convert(self.model.image_info).get_blocks(
+                self._patch_size)
+            if out is None or out.shape[0] < n_patches or out.shape[
+                    1:] != blocks.shape[2:]:
+                out = np.empty((n_patches, ) + blocks.shape[2:],
+                               dtype=blocks.dtype)
+            out[offset:offset + n_rows * n_cols].reshape(
+                blocks.shape)[...] = blocks
+            offset += n_rows * n_cols
+            rows, cols = np.mgrid[row:row + n_rows, col:col + n_cols]
+            coords.append(np.stack([rows.ravel(), cols.ravel()], axis=1))
+        return np.concatenate(coords), out
 
 
 class FilteredPixelClassifier(FilteredClassifier):
+    """
+    Classifies the pixels of the tiles selected by the filter.
+    With dedup, only the distinct colours of each batch are predicted.
+    """
+
+    def __init__(self,
+                 model: "Model",
+                 feature: str,
+                 _filter: Filter,
+                 array_factory: ArrayFactory = None,
+                 pipeline: Pipeline = None,
+                 max_read_size: int = DEFAULT_MAX_READ_SIZE,
+                 dedup: bool = False):
+        super().__init__(model, feature, _filter, array_factory, pipeline,
+                         max_read_size)
+        self.dedup = dedup
 
     def classify(self,
                  slide: Slide,
@@ -203,72 +675,121 @@ class FilteredPixelClassifier(FilteredClassifier):
             raise RuntimeError(
                 f'Not expecting patch size, found {self._patch_size}')
 
+        self._set_tuner(batch_size)
         slide_array = slide[level]
         filter_array = self._filter.array
-        zoom_factor = (
+        tile_size = (
             slide_array.size[0] // filter_array.shape[0],
             slide_array.size[1] // filter_array.shape[1],
         )
-        tile_size = zoom_factor
-        patch_coords = np.argwhere(filter_array) * tile_size
-        n_patches = len(patch_coords)
-        predictions = np.empty(n_patches)
-        patches = []
-        for patch_coord in patch_coords:
-            x, y = patch_coord
-
-            patch = slide_array[x:x + tile_size[0],
-                                y:y + tile_size[1]].convert(
-                                    self.model.image_info).array
-            patches.append(patch.reshape(-1, 3))
-
-        to_predict = np.concatenate(patches) if patches else np.empty(
-            (0, 3), dtype='uint8')
+        rects = self._get_rects(filter_array, tile_size)
         channel_first = (
             self.model.image_info.channel == ImageInfo.Channel.FIRST)
-        batch_iterator = BatchIterator(batch_size, channel_first)
-        batch_iterator.append(to_predict)
-
-        predictions = self._predict_by_batch(batch_iterator, True)
-
         dtype = 'uint8' if threshold or round_to_0_100 else 'float32'
         res = self.array_factory.zeros(slide_array.size, dtype=dtype)
-        patch_area = tile_size[0] * tile_size[1]
-
-        for i in range(n_patches):
-            patch_coord = patch_coords[i]
-            x, y = patch_coord
-            i = i * patch_area
-            patch = predictions[i:i + patch_area].reshape(tile_size)
-            patch = self._threshold(patch, threshold)
-            patch = self._round_to_0_100(patch, round_to_0_100)
-            res[x:x + tile_size[0], y:y + tile_size[1]] = patch
 
+        def read(rects):
+            return self._read_rects(slide_array, rects, tile_size)
+
+        def convert(item):
+            rects, regions = item
+            pixels = [
+                region.convert(self._input_image_info).array
+                for region in regions
+            ]
+            pixels = [
+                p.reshape(3, -1) if channel_first else p.reshape(-1, 3)
+                for p in pixels
+            ]
+            if len(pixels) == 1:
+                return rects, pixels[0]
+            return rects, np.concatenate(pixels,
+                                         axis=1 if channel_first else 0)
+
+        def predict(item):
+            rects, pixels = item
+            return rects, self._predict_in_batches(pixels, batch_size,
+                                                   channel_first)
+
+        def write(item):
+            rects, predictions = item
+            offset = 0
+            for row, col, n_rows, n_cols in rects:
+                shape = (n_rows * tile_size[0], n_cols * tile_size[1])
+                rect = predictions[offset:offset +
+                                   shape[0] * shape[1]].reshape(shape)
+                offset += rect.size
+                rect = self._threshold(rect, threshold)
+                rect = self._round_to_0_100(rect, round_to_0_100)
+                x, y = row * tile_size[0], col * tile_size[1]
+                res[x:x + shape[0], y:y + shape[1]] = rect
+
+        self._run(
+            self._group_rects(rects, tile_size[0] * tile_size[1], batch_size),
+            read, convert, predict, write)
         return self._get_mask(slide, res, level,
                               slide.level_downsamples[level], round_to_0_100)
 
 
 class RowSplitter:
+    """
+    Accumulates predictions and splits them in rows of col_size values.
+    Predictions are copied once in a float32 buffer whose capacity is a
+    multiple of col_size; split returns the completed rows as a view on
+    it, valid until the next append or split, after which the partial
+    row is moved to the head of the buffer.
+    """
 
     def __init__(self, col_size: int):
         self._col_size = col_size
-        self._buffer = np.empty((0), dtype='float32')
+        self._buffer = np.empty(col_size, dtype='float32')
+        self._size = 0
+        self._split_size = 0
         self._row_index = 0
 
     class RowsNotFound(Exception):
         ...
 
     def append(self, data: np.ndarray):
-        self._buffer = np.append(self._buffer, data)
+        self._discard_split_rows()
+        size = self._size + data.size
+        if size > self._buffer.size:
+            capacity = max(2 * self._buffer.size,
+                           math.ceil(size / self._col_size) * self._col_size)
+            buffer = np.empty(capacity, dtype=self._buffer.dtype)
+            buffer[:self._size] = self._buffer[:self._size]
+            self._buffer = buffer
+        self._buffer[self._size:size] = data.reshape(-1)
+        self._size = size
+
+    def seek(self, row_index: int):
+        """
+        Moves to row_index the row of the next appended predictions.
+        All the appended predictions must have been split.
+        """
+        self._discard_split_rows()
+        if self._size:
+            raise RuntimeError(
+                f'{self._size} predictions not split before seeking')
+        self._row_index = row_index
 
     def split(self) -> Tuple[int, np.ndarray]:
-        n_rows = self._buffer.size // self._col_size
+        self._discard_split_rows()
+        n_rows = self._size // self._col_size
         if n_rows:
-            rows = np.array(self._buffer[:n_rows * self._col_size]).reshape(
+            self._split_size = n_rows * self._col_size
+            rows = self._buffer[:self._split_size].reshape(
                 n_rows, self._col_size)
-            self._buffer = self._buffer[n_rows * self._col_size:]
             row_index = self._row_index
             self._row_index += n_rows
             return (row_index, rows)
         else:
             raise RowSplitter.RowsNotFound()
+
+    def _discard_split_rows(self):
+        if self._split_size:
+            remaining = self._size - self._split_size
+            self._buffer[:remaining] = self._buffer[self._split_size:self.
+                                                    _size]
+            self._size = remaining
+            self._split_size = 0
@@ -0,0 +1,174 @@
+import logging
+import queue
+import threading
+import time
+from dataclasses import dataclass, field
+from typing import Any, Callable, Dict, Iterable, List
+
+logger = logging.getLogger('pipeline')
+
+_END = object()
+
+
+@dataclass
+class StageStats:
+    name: str
+    workers: int
+    items: int = 0
+    busy: float = 0.
+    elapsed: float = 0.
+
+    @property
+    def utilisation(self) -> float:
+        """
+        Fraction of the pipeline wall time the stage workers spent working.
+        The stage with the highest utilisation is the bottleneck.
+        """
+        if not self.elapsed:
+            return 0.
+        return self.busy / (self.elapsed * self.workers)
+
+    def __str__(self):
+        return (f'{self.name}: {self.items} items, {self.workers} workers, '
+                f'busy {self.busy:.2f}s, utilisation {self.utilisation:.0%}')
+
+
+@dataclass
+class Pipeline:
+    """
+    Runs items through the read, convert, predict and write stages.
+    Each stage has its own pool of worker threads, stages are connected
+    by queues of at most queue_size items, so a slow stage blocks the
+    upstream ones instead of letting items pile up in memory.
+    Items are processed out of order, stage functions must not rely on it.
+    Writes run in a single worker: row bands and journal updates may
+    share zarr chunks, and concurrent writes to the same chunk lose
+    updates.
+    """
+    read_workers: int = 1
+    convert_workers: int = 1
+    predict_workers: int = 1
+    write_workers: int = 1
+    queue_size: int = 4
+    stats: Dict[str, StageStats] = field(default_factory=dict,
+                                         init=False,
+                                         repr=False,
+                                         compare=False)
+
+    STAGES = ('read', 'convert', 'predict', 'write')
+
+    def __post_init__(self):
+        if self.write_workers != 1:
+            raise ValueError(
+                f'invalid write workers {self.write_workers}, writes must '
+                'run in a single worker')
+
+    @classmethod
+    def parse(cls, spec: str) -> "Pipeline":
+        """
+        Creates a pipeline from a comma separated list of worker counts,
+        in stage order, e.g. "2,2,1,1". Missing counts default to 1, the
+        write count must be 1.
+        """
+        try:
+            workers = [int(w) for w in spec.split(',') if w.strip()]
+        except ValueError as ex:
+            raise ValueError(f'invalid pipeline spec {spec}') from ex
+        if len(workers) > len(cls.STAGES) or any(w < 1 for w in workers):
+            raise ValueError(f'invalid pipeline spec {spec}')
+        return cls(**{
+            f'{stage}_workers': w
+            for stage, w in zip(cls.STAGES, workers)
+        })
+
+    def run(self, items: Iterable, read: Callable[[Any], Any],
+            convert: Callable[[Any], Any], predict: Callable[[Any], Any],
+            write: Callable[[Any], None]) -> Dict[str, StageStats]:
+        funcs = dict(zip(self.STAGES, (read, convert, predict, write)))
+        queues = [queue.Queue(self.queue_size) for _ in self.STAGES]
+        stop = threading.Event()
+        errors: List[BaseException] = []
+        self.stats = {
+            stage: StageStats(stage, getattr(self, f'{stage}_workers'))
+            for stage in self.STAGES
+        }
+
+        threads = []
+        for i, stage in enumerate(self.STAGES):
+            output = queues[i + 1] if i + 1 < len(queues) else None
+            running = [self.stats[stage].workers]
+            lock = threading.Lock()
+            for _ in range(self.stats[stage].workers):
+                threads.append(
+                    threading.Thread(target=self._work,
+                                     args=(funcs[stage], self.stats[stage],
+                                           queues[i], output, running, lock,
+                                           stop, errors),
+                                     name=f'pipeline-{stage}',
+                                     daemon=True))
+
+        start = time.perf_counter()
+        for thread in threads:
+            thread.start()
+        try:
+            for item in items:
+                if not self._put(queues[0], item, stop):
+                    break
+            self._put(queues[0], _END, stop)
+        except BaseException as ex:
+            errors.append(ex)
+            stop.set()
+        for thread in threads:
+            thread.join()
+
+        elapsed = time.perf_counter() - start
+        for stats in self.stats.values():
+            stats.elapsed = elapsed
+            logger.info('%s', stats)
+
+        if errors:
+            raise errors[0]
+        return self.stats
+
+    @staticmethod
+    def _work(func, stats, input_queue, output_queue, running, lock, stop,
+              errors):
+        while not stop.is_set():
+            try:
+                item = input_queue.get(timeout=.1)
+            except queue.Empty:
+                continue
+            if item is _END:
+                # let the other workers of the stage see the end too
+                input_queue.put(_END)
+                break
+            start = time.perf_counter()
+            try:
+                res = func(item)
+            except BaseException as ex:
+                with lock:
+                    errors.append(ex)
+                stop.set()
+                break
+            with lock:
+                stats.busy += time.perf_counter() - start
+                stats.items += 1
+            if output_queue is not None and not Pipeline._put(
+                    output_queue, res, stop):
+                break
+
+        with lock:
+            running[0] -= 1
+            last = running[0] == 0
+        if last and output_queue is not None:
+            Pipeline._put(output_queue, _END, stop)
+
+    @staticmethod
+    def _put(_queue: queue.Queue, item, stop: threading.Event) -> bool:
+        while not stop.is_set():
+            try:
+                _queue.put(item, timeout=.1)
+                return True
+            except queue.Full:
+                continue
+        return False
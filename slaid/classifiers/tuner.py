@@ -0,0 +1,121 @@
+import logging
+import threading
+from typing import Union
+
+logger = logging.getLogger('batch-tuner')
+
+DEFAULT_MAX_BYTES = 256 * 2**20
+
+
+class BatchSizeTuner:
+    """
+    Chooses the batch size of the model predictions at run time.
+    Starting from min_size, the size is doubled every samples batches as
+    long as the throughput (items per second) improves by more than
+    tolerance and a batch of the next size fits in max_bytes of input;
+    the size is then kept at the knee of the throughput curve.
+    If the latency per item of the following batches drifts from the one
+    measured at the knee by more than drift, the search starts again.
+    The first batch of each size is a warm-up and is not measured.
+    """
+
+    def __init__(self,
+                 min_size: int = 1,
+                 max_size: int = None,
+                 max_bytes: int = DEFAULT_MAX_BYTES,
+                 samples: int = 3,
+                 tolerance: float = .1,
+                 drift: float = .5):
+        self.min_size = min_size
+        self.max_size = max_size
+        self.max_bytes = max_bytes
+        self.samples = samples
+        self.tolerance = tolerance
+        self.drift = drift
+        self._lock = threading.Lock()
+        self._item_bytes = 0
+        self._search(min_size)
+
+    @classmethod
+    def create(cls, model, **kwargs) -> "BatchSizeTuner":
+        # patches are large items, pixels tiny ones
+        min_size = 1 if getattr(model, 'patch_size', None) else 1024
+        return cls(min_size=min_size, **kwargs)
+
+    @property
+    def batch_size(self) -> int:
+        return self._size
+
+    @property
+    def searching(self) -> bool:
+        return self._searching
+
+    def update(self, items: int, nbytes: int, elapsed: float):
+        """
+        Records that a batch of items, of nbytes, was predicted in elapsed
+        seconds.
+        """
+        if not items:
+            return
+        with self._lock:
+            self._item_bytes = max(self._item_bytes, nbytes / items)
+            if self._warmup:
+                self._warmup = False
+                return
+            self._items += items
+            self._elapsed += elapsed
+            self._batches += 1
+            if self._batches < self.samples:
+                return
+
+            throughput = self._items / max(self._elapsed, 1e-9)
+            self._reset_samples()
+            if self._searching:
+                self._step(throughput)
+            else:
+                self._check_drift(throughput)
+
+    def _step(self, throughput: float):
+        if self._best is None or \
+                throughput > self._best[1] * (1 + self.tolerance):
+            self._best = (self._size, throughput)
+            if self._fits(self._size * 2):
+                self._set_size(self._size * 2)
+                return
+        self._searching = False
+        self._set_size(self._best[0])
+        logger.info('batch size tuned to %s (%.0f items/s)', self._best[0],
+                    self._best[1])
+
+    def _check_drift(self, throughput: float):
+        ratio = self._best[1] / throughput
+        if ratio > 1 + self.drift or ratio < 1 / (1 + self.drift):
+            logger.info(
+                'latency per item changed by %.0f%% at batch size %s, '
+                'tuning again', (ratio - 1) * 100, self._size)
+            self._search(self.min_size)
+
+    def _fits(self, size: int) -> bool:
+        return (self.max_size is None or size <= self.max_size) and \
+            size * self._item_bytes <= self.max_bytes
+
+    def _search(self, size: int):
+        self._searching = True
+        self._best = None
+        self._set_size(size)
+
+    def _set_size(self, size: int):
+        self._size = size
+        self._warmup = True
+        self._reset_samples()
+
+    def _reset_samples(self):
+        self._items = 0
+        self._elapsed = 0.
+        self._batches = 0
+
+
+def get_batch_size(batch_size: Union[int, BatchSizeTuner]) -> int:
+    if isinstance(batch_size, BatchSizeTuner):
+        return batch_size.batch_size
+    return batch_size
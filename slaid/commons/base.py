@@ -1,16 +1,24 @@
 import abc
+import asyncio
+import hashlib
 import inspect
 import logging
 import math
+import os
 import sys
+import threading
+from collections import OrderedDict, deque
+from concurrent.futures import Executor, ThreadPoolExecutor
 from dataclasses import dataclass
 from enum import Enum
-from typing import Dict, List, Tuple
+from typing import Any, Callable, Dict, List, Tuple
 
 import numpy as np
 import PIL
 
 DEFAULT_TILESIZE = 1024
+DEFAULT_TILE_CACHE_SIZE = 512 * 1024**2
+DEFAULT_ASYNC_WORKERS = 4
 logger = logging.getLogger()
 logger.setLevel(logging.DEBUG)
 
@@ -48,6 +56,7 @@ class ImageInfo:
         '0_255->0_1': lambda array: array / 255.,
         '0_255->1_1': lambda array: (array / 255.) * 2 - 1
     }
+    _conversion_plans = {}
 
     @staticmethod
     def create(color_type: str,
@@ -58,32 +67,93 @@ class ImageInfo:
                          ImageInfo.Coord(coord), ImageInfo.Channel(channel),
                          ImageInfo.Range(pixel_range))
 
-    def convert(self, array: np.ndarray,
-                array_image_info: "ImageInfo") -> np.ndarray:
-        if self == array_image_info:
+    def convert(self,
+                array: np.ndarray,
+                array_image_info: "ImageInfo",
+                out: np.ndarray = None) -> np.ndarray:
+        """
+        Converts array from this ImageInfo to array_image_info.
+        If out is given, the result is written there (it must have the
+        converted shape), otherwise a view is returned when no pixel range
+        conversion is needed, or a new float32 array when it is.
+        """
+        if self == array_image_info and out is None:
             return array
+        return self.get_conversion_plan(array_image_info).apply(array, out)
 
-        if self.color_type != array_image_info.color_type:
-            if self.channel == ImageInfo.Channel.FIRST:
-                array = array[::-1, ...]
-            else:
-                array = array[..., ::-1]
-
-        if self.channel != array_image_info.channel:
-            if self.channel == ImageInfo.Channel.FIRST:
-                array = array.transpose(1, 2, 0)
-            else:
-                array = array.transpose(2, 0, 1)
+    def get_conversion_plan(self,
+                            array_image_info: "ImageInfo") -> "ConversionPlan":
+        key = (self._key(), array_image_info._key())
         try:
-            key = f'{self.pixel_range.value}->{array_image_info.pixel_range.value}'
-            array = self._range_conversion_dict[key](array)
+            return self._conversion_plans[key]
         except KeyError:
-            if self.pixel_range != array_image_info.pixel_range:
+            plan = ConversionPlan.create(self, array_image_info)
+            self._conversion_plans[key] = plan
+            return plan
+
+    def _key(self) -> Tuple[str, str, str, str]:
+        return (self.color_type.value, self.coord.value, self.channel.value,
+                self.pixel_range.value)
+
+
+@dataclass(frozen=True)
+class ConversionPlan:
+    """
+    Conversion between two ImageInfo, computed once per pair.
+    Colour swap and transpose are strided views, the pixel range
+    conversion is a single lookup on a 256-entry float32 table for uint8
+    input, written directly in the output array.
+    """
+    swap_color: bool
+    channel_first: bool
+    transpose: Tuple[int, int, int] = None
+    range_func: Callable = None
+    range_table: np.ndarray = None
+
+    @staticmethod
+    def create(image_info: ImageInfo,
+               array_image_info: ImageInfo) -> "ConversionPlan":
+        channel_first = image_info.channel == ImageInfo.Channel.FIRST
+        transpose = None
+        if image_info.channel != array_image_info.channel:
+            transpose = (1, 2, 0) if channel_first else (2, 0, 1)
+
+        range_func = range_table = None
+        key = f'{image_info.pixel_range.value}->{array_image_info.pixel_range.value}'
+        try:
+            range_func = ImageInfo._range_conversion_dict[key]
+        except KeyError:
+            if image_info.pixel_range != array_image_info.pixel_range:
                 raise RuntimeError(
-                    f'conversion not available from {self.pixel_range} to {array_image_info.pixel_range}'
+                    f'conversion not available from {image_info.pixel_range} to {array_image_info.pixel_range}'
                 )
-
-        return array
+        else:
+            range_table = range_func(np.arange(256)).astype('float32')
+
+        return ConversionPlan(
+            image_info.color_type != array_image_info.color_type,
+            channel_first, transpose, range_func, range_table)
+
+    def apply(self, array: np.ndarray, out: np.ndarray = None) -> np.ndarray:
+        if self.swap_color:
+            array = array[::-1,
+                          ...] if self.channel_first else array[..., ::-1]
+        if self.transpose:
+            array = array.transpose(self.transpose)
+
+        if self.range_func is None:
+            if out is None:
+                return array
+            np.copyto(out, array, casting='unsafe')
+            return out
+
+        if out is None:
+            out = np.empty(array.shape, dtype=self.range_table.dtype)
+        if array.dtype == np.uint8 and out.dtype == self.range_table.dtype:
+            np.take(self.range_table, array, out=out, mode='clip')
+        else:
+            out[...] = self.range_func(array)
+        return out
 
 
 class Image(abc.ABC):
@@ -97,6 +167,24 @@ class Image(abc.ABC):
         pass
 
 
+class ArrayImage(Image):
+
+    def __init__(self, array: np.ndarray, image_info: ImageInfo):
+        self._array = array
+        self.image_info = image_info
+
+    @property
+    def dimensions(self) -> Tuple[int, int]:
+        if self.image_info.channel == ImageInfo.Channel.FIRST:
+            return self._array.shape[1:][::-1]
+        return self._array.shape[:2][::-1]
+
+    def to_array(self, image_info: ImageInfo = None) -> np.ndarray:
+        if image_info is not None:
+            return self.image_info.convert(self._array, image_info)
+        return self._array
+
+
 @dataclass
 class Polygon:
     coords: List[Tuple[int, int]]
@@ -222,6 +310,9 @@ class Filter:
 
 class BasicSlide(abc.ABC):
     IMAGE_INFO = ImageInfo.create('bgr', 'yx', 'first')
+    # attributes not sent when pickling, e.g. native handles that are
+    # reopened lazily in the unpickling process; subclasses extend them
+    _transient_attrs: Tuple[str, ...] = ('_executor', '_own_executor')
 
     class InvalidFile(Exception):
         pass
@@ -233,6 +324,80 @@ class BasicSlide(abc.ABC):
     def __eq__(self, other):
         return self._filename == other.filename and self.masks == other.masks
 
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        for attr in self._transient_attrs:
+            state.pop(attr, None)
+        return state
+
+    @property
+    def async_executor(self) -> Executor:
+        """
+        Executor running the reads of read_region_async, a thread pool of
+        DEFAULT_ASYNC_WORKERS threads owned by the slide (see close) unless
+        set.
+        """
+        executor = getattr(self, '_executor', None)
+        if executor is None:
+            executor = self._executor = self._own_executor = \
+                ThreadPoolExecutor(DEFAULT_ASYNC_WORKERS)
+        return executor
+
+    @async_executor.setter
+    def async_executor(self, executor: Executor):
+        self._executor = executor
+
+    def close(self):
+        """
+        Shuts down the thread pool of read_region_async, if created by the
+        slide; an executor set by the caller is left to the caller.
+        """
+        executor = getattr(self, '_own_executor', None)
+        if executor is not None:
+            executor.shutdown()
+            if self._executor is executor:
+                self._executor = None
+            self._own_executor = None
+
+    async def read_region_async(self, location: Tuple[int, int], level: int,
+                                size: Tuple[int, int]) -> "Image":
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self.async_executor,
+                                          self.read_region, location, level,
+                                          size)
+
+    async def iter_regions_async(self,
+                                 level: int,
+                                 chunk_size: Tuple[int, int],
+                                 max_pending: int = DEFAULT_ASYNC_WORKERS):
+        """
+        Asynchronously iterates over the level by chunks of chunk_size
+        (width, height), row by row, yielding ((x, y), image) with x, y in
+        level coordinates. Up to max_pending reads are kept in flight.
+        """
+        width, height = self.level_dimensions[level]
+        downsample = self.level_downsamples[level]
+        pending = deque()
+        try:
+            for y in range(0, height, chunk_size[1]):
+                for x in range(0, width, chunk_size[0]):
+                    size = (min(chunk_size[0],
+                                width - x), min(chunk_size[1], height - y))
+                    location = (int(x * downsample), int(y * downsample))
+                    pending.append(
+                        ((x, y),
+                         asyncio.ensure_future(
+                             self.read_region_async(location, level, size))))
+                    if len(pending) >= max_pending:
+                        coords, future = pending.popleft()
+                        yield coords, await future
+            while pending:
+                coords, future = pending.popleft()
+                yield coords, await future
+        finally:
+            for _, future in pending:
+                future.cancel()
+
     @abc.abstractproperty
     def dimensions(self) -> Tuple[int, int]:
         pass
@@ -262,11 +427,266 @@ class BasicSlide(abc.ABC):
     def level_count(self):
         return len(self.level_dimensions)
 
+    @property
+    def level_tile_sizes(self) -> List[Tuple[int, int]]:
+        """
+        Native (width, height) tile size of each level, None when the
+        reader does not know it.
+        """
+        return [None] * self.level_count
+
+
+def snap_chunk_to_tiles(
+    chunk: Tuple[int, int],
+    tile_size: Tuple[int, int],
+    multiple_of: Tuple[int, int] = (1, 1)
+) -> Tuple[int, int]:
+    """
+    Rounds each side of chunk to the nearest multiple of the tile size
+    (and of multiple_of), so that chunks starting at 0 share their
+    boundaries with the native tile grid and no tile is decoded twice.
+    chunk, tile_size and multiple_of are all in (rows, cols) order.
+    """
+    if tile_size is None:
+        return chunk
+    snapped = []
+    for side, tile, multiple in zip(chunk, tile_size, multiple_of):
+        unit = tile * multiple // math.gcd(tile, multiple)
+        snapped.append(max(unit, int(round(side / unit)) * unit))
+    return tuple(snapped)
+
+
+def coalesce_cells(cells: np.ndarray,
+                   max_shape: Tuple[int, int] = None) -> np.ndarray:
+    """
+    Covers the selected cells of a boolean 2d array with rectangles, so
+    that adjacent cells can be read at once. Runs of selected cells along
+    a row are merged with the run of the same columns in the row above.
+    Rectangles are at most max_shape (rows, cols) cells.
+    Returns an (N, 4) array of (row, col, n_rows, n_cols).
+    """
+    cells = np.asarray(cells, dtype='bool')
+    max_rows, max_cols = max_shape or cells.shape
+    rects = []
+    open_rects = {}
+    for row in range(cells.shape[0]):
+        edges = np.diff(cells[row].astype('int8'), prepend=0, append=0)
+        still_open = {}
+        for start, stop in zip(
+                np.flatnonzero(edges == 1).tolist(),
+                np.flatnonzero(edges == -1).tolist()):
+            for col in range(start, stop, max_cols):
+                run = (col, min(max_cols, stop - col))
+                rect = open_rects.get(run)
+                if rect is not None and rect[2] < max_rows:
+                    rect[2] += 1
+                else:
+                    rect = [row, col, 1, run[1]]
+                    rects.append(rect)
+                still_open[run] = rect
+        open_rects = still_open
+    return np.array(rects, dtype='int64').reshape(-1, 4)
+
+
+def as_blocks(array: np.ndarray, block_size: Tuple[int, int],
+              channel_first: bool) -> np.ndarray:
+    """
+    Returns a read-only view of array as a grid of blocks of block_size
+    (rows, cols), without copying. The view has shape
+    (rows, cols, C, block rows, block cols) if channel_first, otherwise
+    (rows, cols, block rows, block cols, C). Incomplete blocks at the
+    borders are left out.
+    """
+    if channel_first:
+        channels, height, width = array.shape
+        channel_stride, row_stride, col_stride = array.strides
+    else:
+        height, width, channels = array.shape
+        row_stride, col_stride, channel_stride = array.strides
+    grid = (height // block_size[0], width // block_size[1])
+    grid_strides = (row_stride * block_size[0], col_stride * block_size[1])
+    if channel_first:
+        shape = grid + (channels, ) + tuple(block_size)
+        strides = grid_strides + (channel_stride, row_stride, col_stride)
+    else:
+        shape = grid + tuple(block_size) + (channels, )
+        strides = grid_strides + (row_stride, col_stride, channel_stride)
+    return np.lib.stride_tricks.as_strided(array,
+                                           shape=shape,
+                                           strides=strides,
+                                           writeable=False)
+
+
+class TileCache:
+    """
+    LRU cache of decoded tiles, bounded by a byte budget.
+    Tiles are keyed by (level, tile column, tile row) on a grid of
+    tile_size pixels at the given level.
+    """
+
+    def __init__(self,
+                 max_bytes: int = DEFAULT_TILE_CACHE_SIZE,
+                 tile_size: int = DEFAULT_TILESIZE):
+        self.max_bytes = max_bytes
+        self.tile_size = tile_size
+        self.hits = 0
+        self.misses = 0
+        self._tiles: OrderedDict = OrderedDict()
+        self._nbytes = 0
+        self._lock = threading.Lock()
+
+    @property
+    def nbytes(self) -> int:
+        return self._nbytes
+
+    def __len__(self):
+        return len(self._tiles)
+
+    def get(self, key: Tuple[int, int, int]) -> np.ndarray:
+        with self._lock:
+            try:
+                tile = self._tiles[key]
+            except KeyError:
+                self.misses += 1
+                return None
+            self._tiles.move_to_end(key)
+            self.hits += 1
+            return tile
+
+    def put(self, key: Tuple[int, int, int], tile: np.ndarray):
+        if tile.nbytes > self.max_bytes:
+            return
+        with self._lock:
+            if key in self._tiles:
+                self._nbytes -= self._tiles.pop(key).nbytes
+            self._tiles[key] = tile
+            self._nbytes += tile.nbytes
+            while self._nbytes > self.max_bytes:
+                _, evicted = self._tiles.popitem(last=False)
+                self._nbytes -= evicted.nbytes
+
+    def clear(self):
+        with self._lock:
+            self._tiles.clear()
+            self._nbytes = 0
+
+    def __getstate__(self):
+        return {'max_bytes': self.max_bytes, 'tile_size': self.tile_size}
+
+    def __setstate__(self, state):
+        self.__init__(**state)
+
+
+class LevelCache:
+    """
+    Decoded slide levels saved as .npy files in cache_dir and opened as
+    read-only memory maps, so that later runs (in any process) on the same
+    slide and level slice them without decoding again.
+    Levels are decoded lazily in bands of rows_per_read rows, when a slice
+    first needs them; a bitmap next to each level records the bands
+    written.
+    Files are keyed by slide path, modification time, level and the image
+    info of the reader, which sets their layout.
+    """
+
+    def __init__(self, cache_dir: str, rows_per_read: int = DEFAULT_TILESIZE):
+        self.cache_dir = cache_dir
+        self.rows_per_read = rows_per_read
+
+    def get(self,
+            slide: BasicSlide,
+            level: int,
+            image_info: ImageInfo,
+            rows: slice = None) -> np.ndarray:
+        """
+        Returns the level as a read-only memory map, after caching the
+        bands that overlap rows (by default all of them). Rows of other
+        bands may not be filled yet.
+        """
+        path = self.get_path(slide.filename, level, image_info)
+        width, height = slide.level_dimensions[level]
+        channel_first = image_info.channel == ImageInfo.Channel.FIRST
+        start, stop, _ = (rows or slice(None)).indices(height)
+        band_count = math.ceil(height / self.rows_per_read)
+
+        # the level file is created before its bitmap, so bands marked as
+        # written are always found in it
+        self._create(path, (3, height, width) if channel_first else
+                     (height, width, 3), 'uint8')
+        self._create(self._get_bands_path(path), (band_count, ), 'bool')
+        bands = np.load(self._get_bands_path(path), mmap_mode='r+')
+        missing = [
+            band for band in range(start // self.rows_per_read,
+                                   math.ceil(stop / self.rows_per_read))
+            if not bands[band]
+        ]
+        if missing:
+            logger.info('caching %s bands of level %s of %s in %s',
+                        len(missing), level, slide.filename, path)
+            array = np.load(path, mmap_mode='r+')
+            for band in missing:
+                self._write_band(slide, level, array, band, channel_first)
+            array.flush()
+            # concurrent writers produce the same content
+            bands[missing] = True
+            bands.flush()
+        return np.load(path, mmap_mode='r')
+
+    def get_path(self, filename: str, level: int,
+                 image_info: ImageInfo) -> str:
+        filename = os.path.abspath(filename)
+        key = f'{filename}:{os.stat(filename).st_mtime_ns}:{level}:' + \
+            ':'.join(image_info._key())
+        return os.path.join(self.cache_dir,
+                            f'{hashlib.sha1(key.encode()).hexdigest()}.npy')
+
+    @staticmethod
+    def _get_bands_path(path: str) -> str:
+        return f'{os.path.splitext(path)[0]}.bands'
+
+    def _create(self, path: str, shape: Tuple[int, ...], dtype: str):
+        if os.path.exists(path):
+            return
+        os.makedirs(self.cache_dir, exist_ok=True)
+        tmp_path = f'{path}.{os.getpid()}.{threading.get_ident()}.tmp'
+        array = np.lib.format.open_memmap(tmp_path,
+                                          mode='w+',
+                                          dtype=dtype,
+                                          shape=shape)
+        array.flush()
+        del array
+        try:
+            # unlike a rename, link does not replace a file created
+            # concurrently, which may be already partially filled
+            os.link(tmp_path, path)
+        except FileExistsError:
+            pass
+        finally:
+            os.remove(tmp_path)
+
+    def _write_band(self, slide: BasicSlide, level: int, array: np.ndarray,
+                    band: int, channel_first: bool):
+        width, height = slide.level_dimensions[level]
+        y = band * self.rows_per_read
+        rows = min(self.rows_per_read, height - y)
+        downsample = slide.level_downsamples[level]
+        region = slide.read_region((0, int(y * downsample)), level,
+                                   (width, rows)).to_array()
+        if channel_first:
+            array[:, y:y + rows, :] = region
+        else:
+            array[y:y + rows, :, :] = region
+
 
 class Slide(BasicSlide):
 
-    def __init__(self, slide_reader: BasicSlide):
+    def __init__(self,
+                 slide_reader: BasicSlide,
+                 tile_cache: TileCache = None,
+                 level_cache: LevelCache = None):
         self._slide_reader = slide_reader
+        self._tile_cache = tile_cache
+        self._level_cache = level_cache
 
     @property
     def masks(self):
@@ -276,8 +696,12 @@ class Slide(BasicSlide):
     def image_info(self):
         return self._slide_reader.IMAGE_INFO
 
+    @property
+    def tile_cache(self) -> TileCache:
+        return self._tile_cache
+
     def __getitem__(self, key) -> "SlideArray":
-        return BasicSlideArray(self._slide_reader, key, self.image_info)
+        return BasicSlideArray(self, key, self.image_info, self._level_cache)
 
     @property
     def dimensions(self) -> Tuple[int, int]:
@@ -289,11 +713,73 @@ class Slide(BasicSlide):
 
     def read_region(self, location: Tuple[int, int], level: int,
                     size: Tuple[int, int]) -> Image:
-        return self._slide_reader.read_region(location, level, size)
+        if self._tile_cache is None:
+            return self._slide_reader.read_region(location, level, size)
+        return ArrayImage(self._read_cached_region(location, level, size),
+                          self.image_info)
 
     def get_best_level_for_downsample(self, downsample: int):
         return self._slide_reader.get_best_level_for_downsample(downsample)
 
+    def close(self):
+        super().close()
+        self._slide_reader.close()
+
+    def _read_cached_region(self, location: Tuple[int, int], level: int,
+                            size: Tuple[int, int]) -> np.ndarray:
+        tile_size = self._tile_cache.tile_size
+        downsample = self.level_downsamples[level]
+        level_width, level_height = self.level_dimensions[level]
+        x, y = [int(round(c / downsample)) for c in location]
+        width, height = size
+
+        channel_first = self.image_info.channel == ImageInfo.Channel.FIRST
+        region = np.zeros((3, height, width) if channel_first else
+                          (height, width, 3),
+                          dtype='uint8')
+
+        x_start, x_stop = max(x, 0), min(x + width, level_width)
+        y_start, y_stop = max(y, 0), min(y + height, level_height)
+        for tile_y in range(y_start // tile_size,
+                            math.ceil(y_stop / tile_size)):
+            for tile_x in range(x_start // tile_size,
+                                math.ceil(x_stop / tile_size)):
+                tile = self._get_tile(level, tile_x, tile_y)
+                tile_origin_x, tile_origin_y = (tile_x * tile_size,
+                                                tile_y * tile_size)
+                src_x = slice(
+                    max(x_start, tile_origin_x) - tile_origin_x,
+                    min(x_stop, tile_origin_x + tile_size) - tile_origin_x)
+                src_y = slice(
+                    max(y_start, tile_origin_y) - tile_origin_y,
+                    min(y_stop, tile_origin_y + tile_size) - tile_origin_y)
+                dst_x = slice(src_x.start + tile_origin_x - x,
+                              src_x.stop + tile_origin_x - x)
+                dst_y = slice(src_y.start + tile_origin_y - y,
+                              src_y.stop + tile_origin_y - y)
+                if channel_first:
+                    region[:, dst_y, dst_x] = tile[:, src_y, src_x]
+                else:
+                    region[dst_y, dst_x, :] = tile[src_y, src_x, :]
+        return region
+
+    def _get_tile(self, level: int, tile_x: int, tile_y: int) -> np.ndarray:
+        key = (level, tile_x, tile_y)
+        tile = self._tile_cache.get(key)
+        if tile is None:
+            tile_size = self._tile_cache.tile_size
+            downsample = self.level_downsamples[level]
+            level_width, level_height = self.level_dimensions[level]
+            location = (int(tile_x * tile_size * downsample),
+                        int(tile_y * tile_size * downsample))
+            size = (min(tile_size, level_width - tile_x * tile_size),
+                    min(tile_size, level_height - tile_y * tile_size))
+            tile = np.ascontiguousarray(
+                self._slide_reader.read_region(location, level,
+                                               size).to_array())
+            self._tile_cache.put(key, tile)
+        return tile
+
     @property
     def level_dimensions(self):
         return self._slide_reader.level_dimensions
@@ -302,6 +788,10 @@ class Slide(BasicSlide):
     def level_downsamples(self):
         return self._slide_reader.level_downsamples
 
+    @property
+    def level_tile_sizes(self) -> List[Tuple[int, int]]:
+        return self._slide_reader.level_tile_sizes
+
 
 class SlideArray(abc.ABC):
 
@@ -314,26 +804,52 @@ class SlideArray(abc.ABC):
         ...
 
     @abc.abstractmethod
-    def convert(self, image_info: ImageInfo) -> "SlideArray":
+    def convert(self,
+                image_info: ImageInfo,
+                out: np.ndarray = None) -> "SlideArray":
         ...
 
     @abc.abstractproperty
     def size(self) -> Tuple[int, int]:
         ...
 
+    @property
+    def tile_size(self) -> Tuple[int, int]:
+        """
+        Native (rows, cols) tile size of the underlying level, if known.
+        """
+        return None
+
+    def get_blocks(self, block_size: Tuple[int, int]) -> np.ndarray:
+        """
+        Returns a view of the array as a grid of blocks of block_size
+        (rows, cols) without copying, see as_blocks for the layout.
+        """
+        return as_blocks(self.array, block_size,
+                         self.image_info.channel == ImageInfo.Channel.FIRST)
+
 
 class BasicSlideArray(SlideArray):
 
-    def __init__(self, slide: BasicSlide, level: int, image_info: ImageInfo):
+    def __init__(self,
+                 slide: BasicSlide,
+                 level: int,
+                 image_info: ImageInfo,
+                 level_cache: LevelCache = None):
         self._slide = slide
         self._level = level
         self.image_info = image_info
+        self._level_cache = level_cache
         self._array: np.ndarray = None
 
     @property
     def array(self):
         if self._array is not None:
             return self._array
+        if self._level_cache is not None:
+            self._array = self._level_cache.get(self._slide, self._level,
+                                                self.image_info)
+            return self._array
         logger.warn('reading the whole slide...')
 
         image = self._slide.read_region(
@@ -347,9 +863,14 @@ class BasicSlideArray(SlideArray):
             return min(slice_value,
                        limit) if slice_value is not None else limit
 
-        if self._array is not None:
-            array = self._array[:, key[0], key[1]] if self._is_channel_first(
-            ) else self._array[key[0], key[1], :]
+        level_array = self._array
+        if level_array is None and self._level_cache is not None:
+            # a partially cached level is not kept as self._array
+            level_array = self._level_cache.get(self._slide, self._level,
+                                                self.image_info, key[0])
+        if level_array is not None:
+            array = level_array[:, key[0], key[1]] if self._is_channel_first(
+            ) else level_array[key[0], key[1], :]
         else:
             slice_x = key[1]
             slice_y = key[0]
@@ -376,8 +897,10 @@ class BasicSlideArray(SlideArray):
         slide_array = self._clone(array)
         return slide_array
 
-    def convert(self, image_info: ImageInfo) -> SlideArray:
-        array = self.image_info.convert(self.array, image_info)
+    def convert(self,
+                image_info: ImageInfo,
+                out: np.ndarray = None) -> SlideArray:
+        array = self.image_info.convert(self.array, image_info, out)
         return self._clone(array, image_info)
 
     @property
@@ -387,6 +910,11 @@ class BasicSlideArray(SlideArray):
             ) else self._array.shape[:2]
         return self._slide.level_dimensions[self._level][::-1]
 
+    @property
+    def tile_size(self) -> Tuple[int, int]:
+        tile_size = self._slide.level_tile_sizes[self._level]
+        return tile_size[::-1] if tile_size else None
+
     def _clone(self,
                array: np.ndarray = None,
                image_info: ImageInfo = None) -> SlideArray:
@@ -399,6 +927,26 @@ class BasicSlideArray(SlideArray):
         return self.image_info.channel == ImageInfo.Channel.FIRST
 
 
+class Journal:
+    """
+    Records which rows of an output array are completed, so that an
+    interrupted classification can be resumed skipping them.
+    Rows are set done after they are written to the output.
+    """
+
+    def __init__(self, array):
+        self._array = array
+
+    def __len__(self):
+        return self._array.shape[0]
+
+    def is_done(self, start: int, stop: int) -> bool:
+        return bool(np.all(self._array[start:stop]))
+
+    def set_done(self, start: int, stop: int):
+        self._array[start:stop] = True
+
+
 class ArrayFactory(abc.ABC):
 
     @abc.abstractmethod
@@ -409,6 +957,22 @@ class ArrayFactory(abc.ABC):
     def zeros(self, shape: Tuple[int, int], dtype: str):
         ...
 
+    def journal(self, n_rows: int) -> Journal:
+        """
+        Returns the journal of the array last created; it is kept in memory
+        unless the factory persists it with its arrays.
+        """
+        return Journal(np.zeros(n_rows, dtype='bool'))
+
+    def resume(self, shape: Tuple[int, int], dtype: str,
+               run_key: str) -> Tuple[Any, Journal]:
+        """
+        Returns an empty array and its journal. Factories that persist
+        their arrays may return instead the array and the journal left by
+        an interrupted run with the same shape, dtype and run_key.
+        """
+        return self.empty(shape, dtype), self.journal(shape[0])
+
 
 class NumpyArrayFactory(ArrayFactory):
 
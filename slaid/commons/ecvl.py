@@ -49,8 +49,10 @@ class Image(BaseImage):
         self._image = image
 
     def to_array(self, image_info: ImageInfo = None):
-        # FIXME
-        array = np.array(self._image)
+        # the ECVL buffer is exposed through the buffer protocol as (c, x, y)
+        # without copying; swapping the spatial axes gives a yx view.
+        # Conversions to other layouts are strided views as well.
+        array = np.asarray(self._image)
         array = array.transpose(0, 2, 1)
 
         if image_info is not None:
@@ -64,14 +66,28 @@ class Image(BaseImage):
 
 class BasicSlide(base.BasicSlide):
     IMAGE_INFO = Image.IMAGE_INFO
+    _transient_attrs = base.BasicSlide._transient_attrs + ('_handle', )
 
     def __init__(self, filename: str):
         super().__init__(filename)
-        self._slide = OpenSlideImage(filename)
+        self._handle = OpenSlideImage(filename)
+        self._level_dimensions = [
+            tuple(d) for d in self._handle.GetLevelsDimensions()
+        ]
+        self._level_downsamples = list(self._handle.GetLevelDownsamples())
+        self._level_tile_sizes = None
+
+    @property
+    def _slide(self) -> OpenSlideImage:
+        # the ECVL handle is not serializable, it is reopened after
+        # unpickling
+        if getattr(self, '_handle', None) is None:
+            self._handle = OpenSlideImage(self._filename)
+        return self._handle
 
     @property
     def dimensions(self) -> Tuple[int, int]:
-        return tuple(self._slide.GetLevelsDimensions()[0])
+        return self._level_dimensions[0]
 
     def read_region(self, location: Tuple[int, int], level,
                     size: Tuple[int, int]) -> Image:
@@ -82,11 +98,20 @@ class BasicSlide(base.BasicSlide):
 
     @property
     def level_dimensions(self) -> List[Tuple[int, int]]:
-        return [tuple(d) for d in self._slide.GetLevelsDimensions()]
+        return self._level_dimensions
 
     @property
     def level_downsamples(self):
-        return self._slide.GetLevelDownsamples()
+        return self._level_downsamples
+
+    @property
+    def level_tile_sizes(self) -> List[Tuple[int, int]]:
+        # ECVL does not expose the slide properties, tile sizes are read
+        # through openslide-python
+        if self._level_tile_sizes is None:
+            from slaid.commons.openslide import BasicSlide as OpenSlide
+            self._level_tile_sizes = OpenSlide(self._filename).level_tile_sizes
+        return self._level_tile_sizes
 
 
 def load(filename: str):
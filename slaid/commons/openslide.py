@@ -1,4 +1,4 @@
-from typing import Tuple
+from typing import List, Tuple
 
 import numpy as np
 from openslide import open_slide
@@ -28,13 +28,26 @@ class Image(BaseImage):
 
 class BasicSlide(BaseSlide):
     IMAGE_INFO = Image.IMAGE_INFO
+    _transient_attrs = BaseSlide._transient_attrs + ('_handle', )
 
     def __init__(self, filename: str):
         super().__init__(filename)
-        self._slide = open_slide(filename)  # not serializable...
-        self._dimensions = self._slide.dimensions
-        self._level_dimensions = self._slide.level_dimensions
-        self._level_downsamples = self._slide.level_downsamples
+        self._handle = open_slide(filename)
+        self._dimensions = self._handle.dimensions
+        self._level_dimensions = self._handle.level_dimensions
+        self._level_downsamples = self._handle.level_downsamples
+        self._level_tile_sizes = [
+            self._get_tile_size(level)
+            for level in range(len(self._level_dimensions))
+        ]
+
+    @property
+    def _slide(self):
+        # the openslide handle is not serializable, it is reopened after
+        # unpickling
+        if getattr(self, '_handle', None) is None:
+            self._handle = open_slide(self._filename)
+        return self._handle
 
     def __eq__(self, other):
         return self._filename == other.filename and self.masks == other.masks
@@ -61,3 +74,15 @@ class BasicSlide(BaseSlide):
     @property
     def level_downsamples(self):
         return self._level_downsamples
+
+    @property
+    def level_tile_sizes(self) -> List[Tuple[int, int]]:
+        return self._level_tile_sizes
+
+    def _get_tile_size(self, level: int) -> Tuple[int, int]:
+        properties = self._handle.properties
+        try:
+            return (int(properties[f'openslide.level[{level}].tile-width']),
+                    int(properties[f'openslide.level[{level}].tile-height']))
+        except KeyError:
+            return None
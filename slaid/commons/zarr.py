@@ -1,9 +1,29 @@
-from typing import Tuple
+import logging
+import math
 import os
+import pickle
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Tuple
 
+import numpy as np
 import zarr
 
 from slaid.commons.base import ArrayFactory as BaseArrayFactory
+from slaid.commons.base import ArrayImage
+from slaid.commons.base import BasicSlide as BaseSlide
+from slaid.commons.base import Image, ImageInfo, Journal
+
+logger = logging.getLogger('slaid.commons.zarr')
+
+
+def open_store(path: str, mode: str = 'a'):
+    ext = os.path.splitext(path)[1]
+    if ext == '.zarr':
+        return zarr.DirectoryStore(path)
+    elif ext == '.zip':
+        return zarr.ZipStore(path, mode=mode)
+    raise BaseSlide.InvalidFile(f'unsupported zarr store {path}')
 
 
 class ArrayFactory(BaseArrayFactory):
@@ -19,21 +39,226 @@ class ArrayFactory(BaseArrayFactory):
 
 
 class GroupArrayFactory(BaseArrayFactory):
+    """
+    Creates the array name in a zarr group, replacing any existing one.
+    Journals are stored as the <name>_journal array, tagged with the run
+    key: resume reuses an existing array only together with a journal of
+    the same run key, so that an interrupted classification is resumed but
+    the output of different parameters is not.
+    Journals of zip stores are kept in memory, since zip entries cannot be
+    rewritten.
+    """
+    RUN_KEY_ATTR = 'run_key'
 
     def __init__(self, name, store: str = None, mode: str = 'a'):
-        if store:
-            ext = os.path.splitext(store)[1]
-            if ext == '.zarr':
-                self._store = zarr.DirectoryStore(store)
-            elif ext == '.zip':
-                self._store = zarr.ZipStore(store, mode=mode)
-        else:
-            self._store = store
+        self._store = open_store(store, mode) if store else store
         self.name = name
         self._root = zarr.group(store=self._store)
 
+    @property
+    def journal_name(self) -> str:
+        return f'{self.name}_journal'
+
     def empty(self, shape: Tuple[int, int], dtype: str):
-        return self._root.empty(self.name, shape=shape, dtype=dtype)
+        self._remove(self.journal_name)
+        return self._root.empty(self.name,
+                                shape=shape,
+                                dtype=dtype,
+                                overwrite=True)
 
     def zeros(self, shape: Tuple[int, int], dtype: str):
-        return self._root.zeros(self.name, shape=shape, dtype=dtype)
+        self._remove(self.journal_name)
+        return self._root.zeros(self.name,
+                                shape=shape,
+                                dtype=dtype,
+                                overwrite=True)
+
+    def journal(self, n_rows: int) -> Journal:
+        if isinstance(self._store, zarr.ZipStore):
+            return super().journal(n_rows)
+        array = self._root.get(self.journal_name)
+        if not isinstance(array, zarr.Array) or array.shape != (n_rows, ):
+            array = self._root.zeros(self.journal_name,
+                                     shape=(n_rows, ),
+                                     dtype='bool',
+                                     overwrite=True)
+        return Journal(array)
+
+    def resume(self, shape: Tuple[int, int], dtype: str,
+               run_key: str) -> Tuple[zarr.Array, Journal]:
+        array = self._root.get(self.name)
+        journal = self._root.get(self.journal_name)
+        same_array = isinstance(array, zarr.Array) and array.shape == tuple(
+            shape) and array.dtype == np.dtype(dtype)
+        same_run = isinstance(journal, zarr.Array) and journal.shape == (
+            shape[0], ) and journal.attrs.get(self.RUN_KEY_ATTR) == run_key
+        if same_array and same_run:
+            logger.info('resuming array %s', self.name)
+            return array, Journal(journal)
+
+        array = self.empty(shape, dtype)
+        journal = self.journal(shape[0])
+        if isinstance(journal._array, zarr.Array):
+            journal._array.attrs[self.RUN_KEY_ATTR] = run_key
+        return array, journal
+
+    def clear(self):
+        """
+        Removes the array and its journal, if any.
+        """
+        self._remove(self.name)
+        self._remove(self.journal_name)
+
+    def _remove(self, name: str):
+        if name in self._root:
+            del self._root[name]
+
+
+class BasicSlide(BaseSlide):
+    """
+    Slide stored as a multiscale zarr pyramid, one (height, width, 3)
+    uint8 array per level named after the level index, see write_slide.
+    Regions are read straight from the zarr chunks.
+    """
+    IMAGE_INFO = ImageInfo.create('rgb', 'yx', 'last')
+    _transient_attrs = BaseSlide._transient_attrs + ('_handle', )
+
+    def __init__(self, filename: str):
+        super().__init__(filename)
+        self._handle = self._open()
+        attrs = self._handle.attrs
+        try:
+            self._level_dimensions = [
+                tuple(d) for d in attrs['level_dimensions']
+            ]
+            self._level_downsamples = attrs['level_downsamples']
+        except KeyError:
+            raise BaseSlide.InvalidFile(
+                f'{filename} is not a multiscale zarr slide')
+        self._level_tile_sizes = [
+            self._handle[str(level)].chunks[1::-1]
+            for level in range(len(self._level_dimensions))
+        ]
+
+    def _open(self) -> zarr.Group:
+        return zarr.open_group(open_store(self._filename, 'r'), mode='r')
+
+    @property
+    def _group(self) -> zarr.Group:
+        if getattr(self, '_handle', None) is None:
+            self._handle = self._open()
+        return self._handle
+
+    @property
+    def dimensions(self) -> Tuple[int, int]:
+        return self._level_dimensions[0]
+
+    def read_region(self, location: Tuple[int, int], level: int,
+                    size: Tuple[int, int]) -> Image:
+        downsample = self._level_downsamples[level]
+        level_width, level_height = self._level_dimensions[level]
+        x, y = [int(round(c / downsample)) for c in location]
+        width, height = size
+
+        region = np.zeros((height, width, 3), dtype='uint8')
+        x_start, x_stop = max(x, 0), min(x + width, level_width)
+        y_start, y_stop = max(y, 0), min(y + height, level_height)
+        if x_start < x_stop and y_start < y_stop:
+            region[y_start - y:y_stop - y, x_start - x:x_stop -
+                   x] = self._group[str(level)][y_start:y_stop, x_start:x_stop]
+        return ArrayImage(region, self.IMAGE_INFO)
+
+    def get_best_level_for_downsample(self, downsample: int):
+        for level in reversed(range(len(self._level_downsamples))):
+            if self._level_downsamples[level] <= downsample:
+                return level
+        return 0
+
+    @property
+    def level_dimensions(self) -> List[Tuple[int, int]]:
+        return self._level_dimensions
+
+    @property
+    def level_downsamples(self) -> List[float]:
+        return self._level_downsamples
+
+    @property
+    def level_tile_sizes(self) -> List[Tuple[int, int]]:
+        return self._level_tile_sizes
+
+
+def write_slide(slide: BaseSlide,
+                path: str,
+                tile_size: int = 512,
+                levels: List[int] = None,
+                workers: int = None,
+                compressor=None) -> BasicSlide:
+    """
+    Converts slide into a multiscale zarr pyramid at path (.zarr or .zip),
+    one array per level chunked by tile_size. Tiles are read and encoded
+    by workers threads, each reading from its own copy of slide.
+    With levels, only those levels are written: the first one becomes level
+    0 of the pyramid, and downsamples are relative to it.
+    """
+    levels = levels if levels is not None else range(slide.level_count)
+    levels = sorted(levels)
+    store = open_store(path, 'w')
+    root = zarr.group(store=store, overwrite=True)
+    target_info = BasicSlide.IMAGE_INFO
+    kwargs = {'compressor': compressor} if compressor is not None else {}
+    local = threading.local()
+
+    def get_reader() -> BaseSlide:
+        # readers are not documented as thread safe, copies reopen their
+        # handles lazily
+        reader = getattr(local, 'reader', None)
+        if reader is None:
+            reader = local.reader = pickle.loads(pickle.dumps(slide))
+        return reader
+
+    def copy_tile(array: zarr.Array, level: int, x: int, y: int):
+        width, height = slide.level_dimensions[level]
+        size = (min(tile_size, width - x), min(tile_size, height - y))
+        downsample = slide.level_downsamples[level]
+        location = (int(x * downsample), int(y * downsample))
+        tile = get_reader().read_region(location, level,
+                                        size).to_array(target_info)
+        array[y:y + size[1], x:x + size[0]] = tile
+
+    with ThreadPoolExecutor(workers) as executor:
+        for index, level in enumerate(levels):
+            width, height = slide.level_dimensions[level]
+            array = root.create(str(index),
+                                shape=(height, width, 3),
+                                chunks=(tile_size, tile_size, 3),
+                                dtype='uint8',
+                                **kwargs)
+            logger.info(
+                'writing level %s (%s x %s) with %s tiles', level, width,
+                height,
+                math.ceil(width / tile_size) * math.ceil(height / tile_size))
+            futures = [
+                executor.submit(copy_tile, array, level, x, y)
+                for y in range(0, height, tile_size)
+                for x in range(0, width, tile_size)
+            ]
+            for future in futures:
+                future.result()
+
+    root.attrs.update({
+        'source':
+        slide.filename,
+        'level_dimensions':
+        [slide.level_dimensions[level] for level in levels],
+        'level_downsamples': [
+            slide.level_downsamples[level] / slide.level_downsamples[levels[0]]
+            for level in levels
+        ]
+    })
+    if isinstance(store, zarr.ZipStore):
+        store.close()
+    return BasicSlide(path)
+
+
+def load(filename: str):
+    return BasicSlide(filename)
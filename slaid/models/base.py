@@ -1,4 +1,5 @@
 import abc
+from typing import Tuple
 
 import numpy as np
 
@@ -24,3 +25,10 @@ class Factory(abc.ABC):
     @abc.abstractmethod
     def get_model(self) -> Model:
         pass
+
+    def get_patch_size(self) -> Tuple[int, int]:
+        """
+        Returns the patch size of the model, None for pixel models.
+        Factories override it to read it without creating the model.
+        """
+        return getattr(self.get_model(), 'patch_size', None)
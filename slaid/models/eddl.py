@@ -2,7 +2,7 @@ import logging
 import os
 from abc import ABC
 from dataclasses import dataclass
-from typing import List
+from typing import List, Tuple
 
 import numpy as np
 import onnx
@@ -144,6 +144,8 @@ class Factory(BaseFactory):
     learn_rate = 1e-5
     list_of_losses: List[str] = None
     list_of_metrics: List[str] = None
+    # cpu threads of the net, -1 for all the cores
+    threads: int = -1
 
     def __post_init__(self):
         self.list_of_losses = self.list_of_losses or ["soft_cross_entropy"]
@@ -157,13 +159,19 @@ class Factory(BaseFactory):
         eddl.load(net, self.filename, "bin")
         return globals()[cls_name](net, name=os.path.basename(self.filename))
 
+    def get_patch_size(self) -> Tuple[int, int]:
+        return globals()[self._get_cls_name()].patch_size
+
     def _build_net(self, net):
+        if self.gpu:
+            computing_service = eddl.CS_GPU(self.gpu, mem="low_mem")
+        else:
+            computing_service = eddl.CS_CPU(th=self.threads)
         eddl.build(net,
                    eddl.rmsprop(self.learn_rate),
                    self.list_of_losses,
                    self.list_of_metrics,
-                   eddl.CS_GPU(self.gpu, mem="low_mem")
-                   if self.gpu else eddl.CS_CPU(),
+                   computing_service,
                    init_weights=False)
 
     def _get_cls_name(self):
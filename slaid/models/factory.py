@@ -1,25 +1,65 @@
 import logging
 import os
+from typing import Tuple
 
 import slaid.models.eddl as eddl
 from slaid.models import Factory as BaseFactory
 from slaid.models import Model
 from slaid.models.commons import Factory as CommonFactory
+from slaid.models.lut import LUTModel
+from slaid.models.parallel import ParallelModel
 from slaid.utils import retrieve_model
 
 logger = logging.getLogger()
 
 
 class Factory(BaseFactory):
+    """
+    Creates the model stored in filename according to its extension.
+    With lut, pixel models are wrapped in a LUTModel whose table, of
+    lut_dtype, is cached in lut_cache_dir.
+    With replicas > 1, a ParallelModel predicts on that many replicas of
+    the model in worker processes; the gpus selected by the gpu mask are
+    assigned to the replicas round robin, while replicas on cpu split the
+    cores evenly unless threads is given.
+    """
+    _backends = {'eddl': eddl}
 
-    def __init__(self, filename, backend: str = 'eddl', **kwargs):
+    def __init__(self,
+                 filename,
+                 backend: str = 'eddl',
+                 lut: bool = False,
+                 lut_dtype: str = 'float16',
+                 lut_cache_dir: str = None,
+                 replicas: int = 1,
+                 **kwargs):
         filename = retrieve_model(filename)
         super().__init__(filename)
         self.backend = backend
+        self.lut = lut
+        self.lut_dtype = lut_dtype
+        self.lut_cache_dir = lut_cache_dir
+        self.replicas = replicas
         self._kwargs = kwargs
-        self._backends = {'eddl': eddl}
+
+    @property
+    def filename(self) -> str:
+        return self._filename
 
     def get_model(self) -> Model:
+        if self.replicas > 1:
+            return ParallelModel(
+                [self._get_replica_factory(i) for i in range(self.replicas)])
+        model = self._get_factory().get_model()
+        if self.lut:
+            model = LUTModel.create(model, self._filename, self.lut_dtype,
+                                    self.lut_cache_dir)
+        return model
+
+    def get_patch_size(self) -> Tuple[int, int]:
+        return self._get_factory().get_patch_size()
+
+    def _get_factory(self) -> BaseFactory:
         _ext_mapping = {
             'pickle': self._get_common_factory,
             'pkl': self._get_common_factory,
@@ -27,20 +67,37 @@ class Factory(BaseFactory):
             'onnx': self._get_onnx_factory
         }
         ext = os.path.splitext(self._filename)[1][1:]
-        return _ext_mapping[ext](**self._kwargs).get_model()
+        return _ext_mapping[ext](**self._kwargs)
+
+    def _get_replica_factory(self, index: int) -> "Factory":
+        kwargs = dict(self._kwargs)
+        gpu = kwargs.get('gpu')
+        if gpu:
+            selected = [i for i, enabled in enumerate(gpu) if enabled]
+            replica_gpu = [0] * len(gpu)
+            replica_gpu[selected[index % len(selected)]] = 1
+            kwargs['gpu'] = replica_gpu
+        else:
+            kwargs.setdefault('threads',
+                              max(1, (os.cpu_count() or 1) // self.replicas))
+        return Factory(self._filename,
+                       self.backend,
+                       lut=self.lut,
+                       lut_dtype=self.lut_dtype,
+                       lut_cache_dir=self.lut_cache_dir,
+                       **kwargs)
 
-    def _get_common_factory(self) -> Model:
+    def _get_common_factory(self, **kwargs) -> Model:
         return CommonFactory(self._filename)
 
     def _get_eddl_factory(self, **kwargs) -> Model:
         return eddl.Factory(self._filename, **kwargs)
 
-    def _get_onnx_factory(self, gpu=None, cls_name: str = None) -> Model:
+    def _get_onnx_factory(self,
+                          gpu=None,
+                          cls_name: str = None,
+                          threads: int = -1) -> Model:
         backend_module = self._backends[self.backend]
         factory = getattr(backend_module, 'OnnxFactory')
-        return factory(
-            self._filename,
-            cls_name,
-            gpu,
-        )
+        return factory(self._filename, cls_name, gpu, threads=threads)
         return factory
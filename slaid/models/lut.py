@@ -0,0 +1,108 @@
+import hashlib
+import logging
+import os
+
+import numpy as np
+
+from slaid.commons.base import ImageInfo
+from slaid.models.base import Model
+
+logger = logging.getLogger('lut-model')
+
+DEFAULT_CACHE_DIR = os.path.join(os.path.expanduser('~'), '.cache', 'slaid',
+                                 'lut')
+N_COLOURS = 2**24
+
+
+class LUTModel(Model):
+    """
+    Wraps a pixel model (3 inputs) with a table of its predictions for
+    all the 2**24 rgb colours, so that predict is a single gather.
+    Tables are stored as uint8 (predictions quantised to 1/255) or
+    float16 in cache_dir, keyed by a hash of the model file, and opened
+    as read-only memory maps.
+    """
+    image_info = ImageInfo.create('rgb', 'yx', 'last')
+    patch_size = None
+    DTYPES = ('uint8', 'float16')
+
+    def __init__(self, model: Model, table: np.ndarray, name: str = None):
+        if table.shape != (N_COLOURS, ) or table.dtype.name not in self.DTYPES:
+            raise ValueError(
+                f'invalid table {table.shape}, {table.dtype} for {model}')
+        self.model = model
+        self.table = table
+        self._decode = np.arange(
+            256, dtype='float32') / 255 if table.dtype == np.uint8 else None
+        super().__init__(name or getattr(model, 'name', None))
+
+    def __str__(self):
+        return str(self.model)
+
+    @staticmethod
+    def create(model: Model,
+               model_filename: str,
+               dtype: str = 'float16',
+               cache_dir: str = None,
+               batch_size: int = 2**20) -> "LUTModel":
+        if getattr(model, 'patch_size', None):
+            raise ValueError(f'{model} is not a pixel model')
+        if dtype not in LUTModel.DTYPES:
+            raise ValueError(f'invalid table dtype {dtype}')
+        path = LUTModel.get_path(model, model_filename, dtype, cache_dir)
+        if not os.path.exists(path):
+            LUTModel._write(model, path, dtype, batch_size)
+        return LUTModel(model, np.load(path, mmap_mode='r'))
+
+    @staticmethod
+    def get_path(model: Model,
+                 model_filename: str,
+                 dtype: str,
+                 cache_dir: str = None) -> str:
+        digest = hashlib.sha1()
+        with open(model_filename, 'rb') as f:
+            for block in iter(lambda: f.read(2**20), b''):
+                digest.update(block)
+        # the table also depends on how colours are fed to the model
+        digest.update(str(model.image_info._key()).encode())
+        return os.path.join(cache_dir or DEFAULT_CACHE_DIR,
+                            f'{digest.hexdigest()}-{dtype}.npy')
+
+    @staticmethod
+    def _write(model: Model, path: str, dtype: str, batch_size: int):
+        logger.info('building lookup table of %s in %s', model, path)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = f'{path}.{os.getpid()}.tmp'
+        table = np.lib.format.open_memmap(tmp_path,
+                                          mode='w+',
+                                          dtype=dtype,
+                                          shape=(N_COLOURS, ))
+        channel_first = model.image_info.channel == ImageInfo.Channel.FIRST
+        for start in range(0, N_COLOURS, batch_size):
+            keys = np.arange(start,
+                             min(start + batch_size, N_COLOURS),
+                             dtype='uint32')
+            colours = np.stack([(keys >> 16) & 255,
+                                (keys >> 8) & 255, keys & 255],
+                               axis=1).astype('uint8')
+            # (1, N, 3) image in the table layout, to the model layout
+            colours = LUTModel.image_info.convert(colours[np.newaxis],
+                                                  model.image_info)
+            colours = colours.reshape(3, -1) if channel_first else \
+                colours.reshape(-1, 3)
+            predictions = np.asarray(model.predict(colours)).reshape(-1)
+            if dtype == 'uint8':
+                predictions = np.rint(np.clip(predictions, 0, 1) * 255)
+            table[start:start + keys.size] = predictions
+        table.flush()
+        del table
+        os.replace(tmp_path, path)
+
+    def predict(self, array: np.ndarray) -> np.ndarray:
+        array = np.asarray(array, dtype='uint8')
+        keys = (array[:, 0].astype('uint32') << 16) | (
+            array[:, 1].astype('uint32') << 8) | array[:, 2]
+        predictions = self.table[keys]
+        if self._decode is not None:
+            return self._decode[predictions]
+        return predictions
@@ -0,0 +1,142 @@
+import logging
+import multiprocessing
+import threading
+import weakref
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import shared_memory
+from typing import List, Tuple
+
+import numpy as np
+
+from slaid.commons.base import ImageInfo
+from slaid.models.base import Factory, Model
+
+logger = logging.getLogger('parallel-model')
+
+# state of the replica processes
+_model: Model = None
+_shared_input: shared_memory.SharedMemory = None
+
+
+class ParallelModel(Model):
+    """
+    Data-parallel predictions on replicas of a model, one per worker
+    process, each created by its own (picklable) factory.
+    Inputs are copied once into a shared memory block, each replica
+    predicts a contiguous shard of the batch read from there, and the
+    predictions are gathered in order.
+    """
+
+    def __init__(self, factories: List[Factory], name: str = None):
+        if not factories:
+            raise ValueError('at least one replica is needed')
+        context = multiprocessing.get_context('spawn')
+        self._executors = [
+            ProcessPoolExecutor(1,
+                                mp_context=context,
+                                initializer=_init_replica,
+                                initargs=(factory, )) for factory in factories
+        ]
+        self._shared_input: shared_memory.SharedMemory = None
+        self._lock = threading.Lock()
+        self._finalizer = weakref.finalize(self, ParallelModel._release,
+                                           self._executors, [None])
+
+        # the first replica may fill caches (e.g. lut tables) the others use
+        image_info, patch_size, description = self._executors[0].submit(
+            _describe).result()
+        for future in [
+                executor.submit(_describe) for executor in self._executors[1:]
+        ]:
+            future.result()
+        self.image_info = image_info
+        self.patch_size = patch_size
+        self._description = description
+        super().__init__(name or description)
+
+    def __str__(self):
+        return self._description
+
+    @property
+    def replicas(self) -> int:
+        return len(self._executors)
+
+    def predict(self, array: np.ndarray) -> np.ndarray:
+        array = np.asarray(array)
+        axis = self._batch_axis()
+        size = array.shape[axis]
+        if size == 0:
+            return np.empty((0, ), dtype='float32')
+
+        with self._lock:
+            shared_input = self._get_shared_input(array.nbytes)
+            np.ndarray(array.shape, array.dtype,
+                       buffer=shared_input.buf)[...] = array
+            bounds = np.linspace(0, size,
+                                 min(self.replicas, size) + 1).astype('int')
+            futures = [
+                executor.submit(_predict_shard, shared_input.name, array.shape,
+                                array.dtype.str, axis, start, stop)
+                for executor, start, stop in zip(self._executors, bounds[:-1],
+                                                 bounds[1:])
+            ]
+            return np.concatenate([future.result() for future in futures])
+
+    def close(self):
+        self._finalizer()
+
+    def _batch_axis(self) -> int:
+        # channel first pixels are (3, N), anything else is batched on axis 0
+        if self.patch_size is None and \
+                self.image_info.channel == ImageInfo.Channel.FIRST:
+            return 1
+        return 0
+
+    def _get_shared_input(self, nbytes: int) -> shared_memory.SharedMemory:
+        if self._shared_input is None or self._shared_input.size < nbytes:
+            if self._shared_input is not None:
+                self._shared_input.close()
+                self._shared_input.unlink()
+            self._shared_input = shared_memory.SharedMemory(create=True,
+                                                            size=nbytes)
+            self._finalizer.detach()
+            self._finalizer = weakref.finalize(self, ParallelModel._release,
+                                               self._executors,
+                                               [self._shared_input])
+        return self._shared_input
+
+    @staticmethod
+    def _release(executors: List[ProcessPoolExecutor],
+                 shared_inputs: List[shared_memory.SharedMemory]):
+        for executor in executors:
+            executor.shutdown()
+        for shared_input in shared_inputs:
+            if shared_input is not None:
+                shared_input.close()
+                shared_input.unlink()
+
+
+def _init_replica(factory: Factory):
+    global _model
+    _model = factory.get_model()
+
+
+def _describe() -> Tuple[ImageInfo, Tuple[int, int], str]:
+    return _model.image_info, getattr(_model, 'patch_size', None), str(_model)
+
+
+def _predict_shard(name: str, shape: Tuple[int, ...], dtype: str, axis: int,
+                   start: int, stop: int) -> np.ndarray:
+    array = np.ndarray(shape, dtype, buffer=_attach(name).buf)
+    shard = array[:, start:stop] if axis == 1 else array[start:stop]
+    return np.asarray(_model.predict(np.ascontiguousarray(shard)))
+
+
+def _attach(name: str) -> shared_memory.SharedMemory:
+    global _shared_input
+    if _shared_input is None or _shared_input.name != name:
+        if _shared_input is not None:
+            _shared_input.close()
+        # the block is owned, and unlinked, by the parent process
+        _shared_input = shared_memory.SharedMemory(name=name)
+    return _shared_input
@@ -1,27 +1,39 @@
 import abc
+import copy
+import json
 import logging
+import multiprocessing
 import os
 import re
+from concurrent.futures import ProcessPoolExecutor
 from dataclasses import dataclass
 from importlib import import_module
-from typing import List
+from typing import List, Tuple, Union
 
 import numpy as np
 from clize import parameters
+from clize.parser import value_converter
 
 import slaid.commons.ecvl as ecvl
+from slaid.cache import ResultCache, array_fingerprint, file_digest
 from slaid.classifiers import BasicClassifier
 from slaid.classifiers.fixed_batch import (FilteredPatchClassifier,
                                            FilteredPixelClassifier,
+                                           MultiPixelClassifier,
                                            PixelClassifier)
-from slaid.commons import ImageInfo
-from slaid.commons.base import Filter
+from slaid.classifiers.pipeline import Pipeline
+from slaid.classifiers.tuner import BatchSizeTuner
+from slaid.commons import ImageInfo, Mask
+from slaid.commons.base import Filter, LevelCache, Slide, TileCache
 from slaid.models.factory import Factory as ModelFactory
 from slaid.models.base import Model
 from slaid.writers import REGISTRY as STORAGE
 from slaid.writers.zarr_io import ZarrStorage
 
 DEFAULT_BATCH_SIZE = 8192
+AUTO_BATCH_SIZE = 'auto'
+
+logger = logging.getLogger('runners')
 
 
 class SlideFactory:
@@ -30,11 +42,15 @@ class SlideFactory:
                  filename: str,
                  basic_slide_module: str,
                  slide_module: str,
-                 image_info: ImageInfo = None):
+                 image_info: ImageInfo = None,
+                 level_cache_dir: str = None,
+                 tile_cache_bytes: int = None):
         self._filename = filename.rstrip('/')
         self._basic_slide_module = basic_slide_module
         self._slide_module = slide_module
         self._image_info = image_info
+        self._level_cache_dir = level_cache_dir
+        self._tile_cache_bytes = tile_cache_bytes
 
     def get_slide(self):
         basic_slide_cls = import_module(
@@ -43,15 +59,39 @@ class SlideFactory:
 
         slide_ext_with_dot = os.path.splitext(self._filename)[-1]
         slide_ext = slide_ext_with_dot[1:]
+        kwargs = {}
+        if self._level_cache_dir:
+            kwargs['level_cache'] = LevelCache(self._level_cache_dir)
+        if self._tile_cache_bytes:
+            kwargs['tile_cache'] = TileCache(self._tile_cache_bytes)
+
+        if self._basic_slide_module == 'zarr':
+            # multiscale zarr slide, not a mask archive
+            return slide_cls(basic_slide_cls(self._filename), **kwargs)
         try:
             basic_slide = STORAGE[slide_ext].load(self._filename)
         except KeyError:
             basic_slide = basic_slide_cls(self._filename)
-        return slide_cls(basic_slide)
+        return slide_cls(basic_slide, **kwargs)
 
 
 @dataclass
 class Runner(abc.ABC):
+    """
+    Classifies the slide in input_path, or every slide in it if it is a
+    directory, writing one output per slide in output_dir.
+    With workers > 1, slides are classified concurrently by a pool of
+    processes, each creating its own model once with model_factory.
+    A failing slide does not stop the others: a summary in input order
+    is logged at the end, and an error is raised if any slide failed.
+    Outputs already in output_dir are resumed by classifiers that keep a
+    journal of the completed rows, unless overwrite_output_if_exists.
+    With a result_cache (and a model_factory, to identify the model),
+    slides whose result is already in output_dir or in the cache are
+    skipped before they are opened.
+    With batch_size AUTO_BATCH_SIZE, the batch size is tuned while
+    classifying, and the tuning carries over to the following slides.
+    """
     input_path: str
     output_dir: str
     model: Model
@@ -64,42 +104,152 @@ class Runner(abc.ABC):
     no_round: bool = False
     filter_slide: str = None
     slide_reader: str = None
-    batch_size: int = None
+    batch_size: Union[int, str] = None
+    level_cache_dir: str = None
+    tile_cache_bytes: int = None
+    pipeline: Pipeline = None
+    workers: int = 1
+    model_factory: ModelFactory = None
+    result_cache: ResultCache = None
 
     def __post_init__(self):
 
         _prepare_output_dir(self.output_dir)
         self._classifier = None
+        self._tuner = None
 
     @abc.abstractproperty
     def classifier(self):
         ...
 
     def run(self):
-        classifiled_slides = []
-        for slide in _get_slides(self.input_path, self.slide_reader):
-            output_path = os.path.join(
-                self.output_dir,
-                f'{os.path.basename(slide.filename)}.{self.writer}')
-
-            storage = ZarrStorage(self.classifier.label, output_path)
-            self.classifier.array_factory = storage
-            mask = self.classifier.classify(slide,
-                                            level=self.level,
-                                            threshold=self.threshold,
-                                            round_to_0_100=not self.no_round,
-                                            batch_size=self.batch_size)
-            slide.masks[self.label] = mask
-            storage.write(mask)
-            storage.add_metadata({
-                'filename': slide.filename,
-                'resolution': slide.dimensions
-            })
+        """
+        Returns the classifier and the classified slides; with workers > 1
+        classifiers live in the worker processes, so None and the output
+        paths are returned instead.
+        """
+        if self.workers > 1:
+            return None, self._run_in_pool()
 
+        classifiled_slides = []
+        for path in _get_slide_paths(self.input_path):
+            key = self._get_cache_key(path)
+            if self._restore(path, key):
+                print(self._get_output_path(path))
+                continue
+            slide = _get_slide(path, self.slide_reader, self.level_cache_dir,
+                               self.tile_cache_bytes)
+            output_path = self._run_slide(slide, key)
             classifiled_slides.append(slide)
             print(output_path)
         return self.classifier, classifiled_slides
 
+    def _get_output_path(self, path: str) -> str:
+        return _get_output_path(self.output_dir, path, self.writer)
+
+    def _get_cache_key(self, path: str) -> str:
+        if self.result_cache is None or self.model_factory is None:
+            return None
+        return _get_cache_key(path, self.model_factory, self.label, self.level,
+                              self.threshold, self.no_round,
+                              getattr(self, '_filter',
+                                      None), self.filter_slide)
+
+    def _get_run_key(self) -> str:
+        if self.model_factory is None:
+            return None
+        return _get_run_key(self.model_factory, getattr(self, '_filter', None),
+                            self.filter_slide)
+
+    def _restore(self, path: str, key: str) -> bool:
+        if key is None or self.overwrite_output_if_exists:
+            return False
+        return self.result_cache.restore(key, self.label,
+                                         self._get_output_path(path), path)
+
+    def _run_slide(self, slide, key: str = None) -> str:
+        """
+        key is the result cache key of the slide, computed before
+        classifying since the output may be the filter slide. Without it,
+        journals are keyed by the model file and the filter of the run.
+        """
+        output_path = self._get_output_path(slide.filename)
+
+        storage = ZarrStorage(self.classifier.label, output_path)
+        if self.overwrite_output_if_exists:
+            storage.clear()
+        self.classifier.array_factory = storage
+        self.classifier.run_key = key or self._get_run_key()
+        mask = self.classifier.classify(slide,
+                                        level=self.level,
+                                        threshold=self.threshold,
+                                        round_to_0_100=not self.no_round,
+                                        batch_size=self._get_batch_size())
+        slide.masks[self.label] = mask
+        storage.write(mask)
+        storage.add_metadata({
+            'filename': slide.filename,
+            'resolution': slide.dimensions
+        })
+        if key is not None:
+            self.result_cache.store(key, storage)
+        return output_path
+
+    def _get_batch_size(self) -> Union[int, BatchSizeTuner]:
+        if self.batch_size != AUTO_BATCH_SIZE:
+            return self.batch_size
+        if self._tuner is None:
+            self._tuner = BatchSizeTuner.create(self.model)
+        return self._tuner
+
+    def _run_in_pool(self) -> List[str]:
+        if self.model_factory is None:
+            raise RuntimeError('a model factory is needed to run on workers')
+        # models are created again by each worker
+        runner = copy.copy(self)
+        runner.model = None
+        runner._classifier = None
+
+        paths = _get_slide_paths(self.input_path)
+        keys = {path: self._get_cache_key(path) for path in paths}
+        results = {
+            path: self._get_output_path(path)
+            for path in paths if self._restore(path, keys[path])
+        }
+        pending = [path for path in paths if path not in results]
+        if pending:
+            with ProcessPoolExecutor(
+                    min(self.workers, len(pending)),
+                    mp_context=multiprocessing.get_context('spawn'),
+                    initializer=_init_worker,
+                    initargs=(runner, )) as executor:
+                futures = {
+                    path: executor.submit(_run_worker, path, keys[path])
+                    for path in pending
+                }
+                for path, future in futures.items():
+                    try:
+                        results[path] = future.result()
+                    except Exception as ex:
+                        logger.error('failed to classify %s: %r', path, ex)
+                        results[path] = ex
+
+        outputs, failures = [], []
+        for path in paths:
+            if isinstance(results[path], Exception):
+                failures.append(path)
+                print(f'FAILED {path}: {results[path]!r}')
+            else:
+                outputs.append(results[path])
+                print(results[path])
+
+        logger.info('classified %s of %s slides', len(outputs), len(paths))
+        if failures:
+            raise RuntimeError(
+                f'{len(failures)} of {len(paths)} slides failed: '
+                f'{", ".join(failures)}')
+        return outputs
+
 
 @dataclass
 class FilteredRunner(Runner):
@@ -107,37 +257,30 @@ class FilteredRunner(Runner):
 
     def __post_init__(self):
         super().__post_init__()
-        self._filter_obj = self._process_filter()
+        self._loaded_filter = None
+
+    @property
+    def _filter_obj(self) -> Filter:
+        # loaded on first use, so that runners are sent to the workers
+        # with the path of the filter slide only
+        if self._loaded_filter is None:
+            self._loaded_filter = self._process_filter()
+        return self._loaded_filter
 
     def _process_filter(self) -> Filter:
         if self._filter:
             return self._convert_condition()
 
     def _convert_condition(self) -> Filter:
-        operator_mapping = {
-            '>': '__gt__',
-            '>=': '__ge__',
-            '<': '__lt__',
-            '<=': '__le__',
-            '==': '__eq__',
-            '!=': '__ne__',
-        }
-
-        condition = self._filter.replace('"', '')
-        parsed = re.match(
-            r"(?P<mask>\w+)\s*(?P<operator>[<>=!]+)\s*(?P<value>\d+\.*\d*)",
-            condition).groupdict()
-        label = parsed['mask']
-        value = float(parsed['value'])
-
+        label, operator, value = _parse_condition(self._filter)
         mask = ZarrStorage(label, self.filter_slide, mode='r').load()
-        operator = operator_mapping[parsed['operator']]
         return getattr(mask, operator)(value)
 
 
 @dataclass
 class SerialRunner(FilteredRunner):
     chunk_size: int = None
+    align_chunks: bool = False
 
     @property
     def classifier(self):
@@ -147,7 +290,8 @@ class SerialRunner(FilteredRunner):
                 self.label,
                 chunk=(self.chunk_size,
                        self.chunk_size) if self.chunk_size else None,
-                _filter=self._filter)
+                _filter=self._filter,
+                align_chunks=self.align_chunks)
         return self._classifier
 
 
@@ -156,7 +300,8 @@ class FilteredPatchRunner(FilteredRunner):
 
     def __post_init__(self):
         super().__post_init__()
-        if self.model.patch_size is None:
+        # with workers, models are only created in the worker processes
+        if self.model is not None and self.model.patch_size is None:
             raise RuntimeError(
                 f'model {self.model_name} does not work with patch')
 
@@ -168,14 +313,19 @@ class FilteredPatchRunner(FilteredRunner):
     @property
     def classifier(self):
         if self._classifier is None:
-            self._classifier = FilteredPatchClassifier(self.model, self.label,
-                                                       self._filter_obj)
+            self._classifier = FilteredPatchClassifier(self.model,
+                                                       self.label,
+                                                       self._filter_obj,
+                                                       pipeline=self.pipeline)
         return self._classifier
 
 
 @dataclass
 class PixelRunner(Runner):
     chunk_size: int = None
+    read_ahead: int = 0
+    align_chunks: bool = False
+    dedup: bool = False
 
     def __post_init__(self):
         super().__post_init__()
@@ -186,13 +336,18 @@ class PixelRunner(Runner):
         if self._classifier is None:
             self._classifier = PixelClassifier(self.model,
                                                self.label,
-                                               chunk_size=self.chunk_size)
+                                               chunk_size=self.chunk_size,
+                                               read_ahead=self.read_ahead,
+                                               align_chunks=self.align_chunks,
+                                               pipeline=self.pipeline,
+                                               dedup=self.dedup)
 
         return self._classifier
 
 
 @dataclass
 class FilteredPixelRunner(FilteredRunner):
+    dedup: bool = False
 
     def __post_init__(self):
         super().__post_init__()
@@ -202,11 +357,226 @@ class FilteredPixelRunner(FilteredRunner):
     def classifier(self):
         if self._classifier is None:
             self._classifier = FilteredPixelClassifier(
-                self.model, self.label, _filter=self._filter_obj)
+                self.model,
+                self.label,
+                _filter=self._filter_obj,
+                pipeline=self.pipeline,
+                dedup=self.dedup)
 
         return self._classifier
 
 
+@dataclass
+class Stage:
+    """
+    A step of a cascade: label is predicted by model at level, on the
+    whole slide or, with _filter, only where a condition on the mask of a
+    previous stage holds (e.g. "tissue>0.8").
+    """
+    label: str
+    model: str
+    level: int
+    _filter: str = None
+
+    @classmethod
+    def parse(cls, spec: str) -> "Stage":
+        """
+        Creates a stage from "label,model,level[,filter]".
+        """
+        fields = [f.strip() for f in spec.split(',')]
+        if len(fields) not in (3, 4):
+            raise ValueError(f'invalid stage {spec}')
+        try:
+            level = int(fields[2])
+        except ValueError as ex:
+            raise ValueError(f'invalid stage {spec}') from ex
+        return cls(fields[0], fields[1], level,
+                   fields[3] if len(fields) == 4 else None)
+
+    @property
+    def filter_label(self) -> str:
+        return _parse_condition(self._filter)[0] if self._filter else None
+
+
+@dataclass
+class CascadeRunner:
+    """
+    Classifies each slide in input_path with stages, in order, in a single
+    run: the slide is opened once, so its readers and level caches are
+    shared by the stages, and the masks of all the stages are written to
+    the same output, which must be a zarr directory: a zip store cannot
+    be appended by several stages. Masks are kept in slide.masks, where
+    the filters of the following stages are taken from.
+    Consecutive stages of pixel models at the same level, without
+    filters, are run in a single pass reading each row band once (see
+    MultiPixelClassifier).
+    Models are created once with model_factory_cls and shared by the
+    slides (and by the stages with the same model).
+    """
+    input_path: str
+    output_dir: str
+    stages: List[Stage]
+    writer: str = 'zarr'
+    threshold: float = None
+    gpu: List[int] = None
+    overwrite_output_if_exists: bool = False
+    no_round: bool = False
+    slide_reader: str = 'ecvl'
+    batch_size: Union[int, str] = None
+    chunk_size: int = None
+    level_cache_dir: str = None
+    tile_cache_bytes: int = None
+    pipeline: Pipeline = None
+    model_factory_cls: type = ModelFactory
+
+    def __post_init__(self):
+        if not self.stages:
+            raise ValueError('at least one stage is needed')
+        if self.writer != 'zarr':
+            raise ValueError(
+                f'unsupported writer {self.writer}, stages write their '
+                'masks into the same zarr output')
+        labels = set()
+        for stage in self.stages:
+            if stage.label in labels:
+                raise ValueError(f'duplicated stage {stage.label}')
+            if stage.filter_label and stage.filter_label not in labels:
+                raise ValueError(
+                    f'filter of stage {stage.label} does not refer to a '
+                    f'previous stage: {stage._filter}')
+            labels.add(stage.label)
+        _prepare_output_dir(self.output_dir)
+        self._models = {}
+        self._model_factories = {}
+        self._tuners = {}
+
+    def run(self) -> List[Slide]:
+        classifiled_slides = []
+        for path in _get_slide_paths(self.input_path):
+            slide = _get_slide(path, self.slide_reader, self.level_cache_dir,
+                               self.tile_cache_bytes)
+            output_path = _get_output_path(self.output_dir, path, self.writer)
+            for stages in self._group_stages():
+                if len(stages) == 1:
+                    self._run_stage(slide, stages[0], output_path)
+                else:
+                    self._run_stages(slide, stages, output_path)
+            classifiled_slides.append(slide)
+            print(output_path)
+        return classifiled_slides
+
+    def _group_stages(self) -> List[List[Stage]]:
+        groups = []
+        for stage in self.stages:
+            if groups and self._is_pixel_stage(stage) and \
+                    self._is_pixel_stage(groups[-1][-1]) and \
+                    groups[-1][-1].level == stage.level:
+                groups[-1].append(stage)
+            else:
+                groups.append([stage])
+        return groups
+
+    def _is_pixel_stage(self, stage: Stage) -> bool:
+        return stage._filter is None and not self._get_model(
+            stage.model).patch_size
+
+    def _run_stage(self, slide: Slide, stage: Stage, output_path: str):
+        logger.info('running stage %s on %s', stage.label, slide.filename)
+        model = self._get_model(stage.model)
+        classifier = self._get_classifier(stage, model, slide)
+        classifier.array_factory = self._get_storage(stage, output_path)
+        classifier.run_key = self._get_run_key(stage, output_path)
+        mask = classifier.classify(slide,
+                                   level=stage.level,
+                                   threshold=self.threshold,
+                                   round_to_0_100=not self.no_round,
+                                   batch_size=self._get_batch_size(
+                                       stage, model))
+        self._save(slide, classifier.array_factory, mask)
+
+    def _run_stages(self, slide: Slide, stages: List[Stage], output_path: str):
+        logger.info('running stages %s on %s in a single pass',
+                    [stage.label for stage in stages], slide.filename)
+        classifiers, batch_sizes = [], {}
+        for stage in stages:
+            model = self._get_model(stage.model)
+            classifier = PixelClassifier(model,
+                                         stage.label,
+                                         self._get_storage(stage, output_path),
+                                         chunk_size=self.chunk_size)
+            classifier.run_key = self._get_run_key(stage, output_path)
+            classifiers.append(classifier)
+            batch_sizes[stage.label] = self._get_batch_size(stage, model)
+        masks = MultiPixelClassifier(classifiers,
+                                     pipeline=self.pipeline).classify(
+                                         slide,
+                                         level=stages[0].level,
+                                         threshold=self.threshold,
+                                         round_to_0_100=not self.no_round,
+                                         batch_size=batch_sizes)
+        for classifier in classifiers:
+            self._save(slide, classifier.array_factory,
+                       masks[classifier.label])
+
+    def _get_storage(self, stage: Stage, output_path: str) -> ZarrStorage:
+        storage = ZarrStorage(stage.label, output_path)
+        if self.overwrite_output_if_exists:
+            storage.clear()
+        return storage
+
+    def _get_batch_size(self, stage: Stage,
+                        model: Model) -> Union[int, BatchSizeTuner]:
+        if self.batch_size == AUTO_BATCH_SIZE:
+            return self._tuners.setdefault(stage.model,
+                                           BatchSizeTuner.create(model))
+        return self.batch_size or (10
+                                   if model.patch_size else DEFAULT_BATCH_SIZE)
+
+    @staticmethod
+    def _save(slide: Slide, storage: ZarrStorage, mask: Mask):
+        slide.masks[storage.name] = mask
+        storage.write(mask)
+        storage.add_metadata({
+            'filename': slide.filename,
+            'resolution': slide.dimensions
+        })
+
+    def _get_model(self, path: str) -> Model:
+        if path not in self._models:
+            factory = self.model_factory_cls(path, gpu=self.gpu)
+            self._models[path] = factory.get_model()
+            self._model_factories[path] = factory
+        return self._models[path]
+
+    def _get_run_key(self, stage: Stage, output_path: str) -> str:
+        # stages resume their journals only with the same model file and
+        # filter mask, which is in the output, written by a previous stage
+        return _get_run_key(self._model_factories[stage.model], stage._filter,
+                            output_path)
+
+    def _get_classifier(self, stage: Stage, model: Model, slide: Slide):
+        if stage._filter is None:
+            if model.patch_size:
+                raise NotImplementedError(
+                    'Prediction patch based without filtering not '
+                    'implemented.')
+            return PixelClassifier(model,
+                                   stage.label,
+                                   chunk_size=self.chunk_size,
+                                   pipeline=self.pipeline)
+
+        label, operator, value = _parse_condition(stage._filter)
+        _filter = getattr(slide.masks[label], operator)(value)
+        cls = FilteredPatchClassifier if model.patch_size else \
+            FilteredPixelClassifier
+        return cls(model, stage.label, _filter, pipeline=self.pipeline)
+
+
+@value_converter(name='SIZE|auto')
+def _batch_size(value: str) -> Union[int, str]:
+    return value if value == AUTO_BATCH_SIZE else int(value)
+
+
 def basic(input_path: str,
           *,
           model: (str, 'm'),
@@ -221,9 +591,11 @@ def basic(input_path: str,
           overwrite_output_if_exists: 'overwrite' = False,
           no_round: bool = False,
           filter_slide: str = None,
-          slide_reader: ('r', parameters.one_of('ecvl', 'openslide')) = 'ecvl',
+          slide_reader: ('r', parameters.one_of('ecvl', 'openslide',
+                                                'zarr')) = 'ecvl',
           batch_size: ('b', int) = None,
-          chunk_size: int = None):
+          chunk_size: int = None,
+          align_chunks: bool = False):
     return SerialRunner(input_path,
                         model_name=model,
                         level=level,
@@ -238,7 +610,8 @@ def basic(input_path: str,
                         filter_slide=filter_slide,
                         slide_reader=slide_reader,
                         batch_size=batch_size,
-                        chunk_size=chunk_size).run()
+                        chunk_size=chunk_size,
+                        align_chunks=align_chunks).run()
 
 
 def fixed_batch(input_path: str,
@@ -255,10 +628,21 @@ def fixed_batch(input_path: str,
                 overwrite_output_if_exists: 'overwrite' = False,
                 no_round: bool = False,
                 filter_slide: str = None,
-                slide_reader: ('r', parameters.one_of('ecvl',
-                                                      'openslide')) = 'ecvl',
+                slide_reader: ('r',
+                               parameters.one_of('ecvl', 'openslide',
+                                                 'zarr')) = 'ecvl',
                 chunk_size: int = None,
-                batch_size: ('b', int) = None):
+                batch_size: ('b', _batch_size) = None,
+                read_ahead: int = 0,
+                align_chunks: bool = False,
+                level_cache_dir: str = None,
+                tile_cache_bytes: int = None,
+                pipeline: str = None,
+                dedup: bool = False,
+                lut: bool = False,
+                replicas: int = 1,
+                workers: int = 1,
+                result_cache_dir: str = None):
 
     kwargs = dict(input_path=input_path,
                   level=level,
@@ -272,26 +656,168 @@ def fixed_batch(input_path: str,
                   no_round=no_round,
                   filter_slide=filter_slide,
                   slide_reader=slide_reader,
-                  batch_size=batch_size)
+                  batch_size=batch_size,
+                  level_cache_dir=level_cache_dir,
+                  tile_cache_bytes=tile_cache_bytes,
+                  pipeline=Pipeline.parse(pipeline) if pipeline else None,
+                  workers=workers)
 
     gpu = _convert_gpu_params(gpu)
-    model = ModelFactory(model, gpu=gpu).get_model()
+    model_factory = ModelFactory(model, gpu=gpu, lut=lut, replicas=replicas)
+    result_cache = ResultCache(result_cache_dir) if result_cache_dir else None
+    kwargs['result_cache'] = result_cache
+    if result_cache and not overwrite_output_if_exists:
+        # nothing to do, neither the model nor the slides are loaded
+        _prepare_output_dir(output_dir)
+        paths = _get_slide_paths(input_path)
+        if all(
+                result_cache.restore(
+                    _get_cache_key(path, model_factory, label, level,
+                                   threshold, no_round, _filter, filter_slide),
+                    label, _get_output_path(output_dir, path, writer), path)
+                for path in paths):
+            for path in paths:
+                print(_get_output_path(output_dir, path, writer))
+            return
+
+    if workers > 1:
+        # the workers create their own models
+        model = None
+        patch_size = model_factory.get_patch_size()
+    else:
+        model = model_factory.get_model()
+        patch_size = model.patch_size
     kwargs['model'] = model
+    kwargs['model_factory'] = model_factory
     if _filter:
         kwargs['_filter'] = _filter
-        if model.patch_size:
+        if patch_size:
             cls = FilteredPatchRunner
         else:
             cls = FilteredPixelRunner
+            kwargs['dedup'] = dedup
     else:
         kwargs.pop('_filter')
         kwargs.pop('filter_slide')
         cls = PixelRunner
         kwargs['chunk_size'] = chunk_size
+        kwargs['read_ahead'] = read_ahead
+        kwargs['align_chunks'] = align_chunks
+        kwargs['dedup'] = dedup
 
     cls(**kwargs).run()
 
 
+def cascade(input_path: str,
+            *,
+            stage: ('s', parameters.multi(min=1)),
+            output_dir: (str, 'o'),
+            threshold: (float, 't') = None,
+            gpu: (int, parameters.multi()) = None,
+            writer: ('w', parameters.one_of(*list(STORAGE.keys()))) = list(
+                STORAGE.keys())[0],
+            overwrite_output_if_exists: 'overwrite' = False,
+            no_round: bool = False,
+            slide_reader: ('r', parameters.one_of('ecvl', 'openslide',
+                                                  'zarr')) = 'ecvl',
+            chunk_size: int = None,
+            batch_size: ('b', _batch_size) = None,
+            level_cache_dir: str = None,
+            tile_cache_bytes: int = None,
+            pipeline: str = None):
+    """
+    Classifies the slides with a cascade of stages, each given as
+    label,model,level[,filter], e.g. -s tissue,tissue.bin,8
+    -s tumor,tumor.bin,0,tissue>0.8
+    """
+    CascadeRunner(
+        input_path,
+        output_dir, [Stage.parse(s) for s in stage],
+        writer=writer,
+        threshold=threshold,
+        gpu=_convert_gpu_params(gpu),
+        overwrite_output_if_exists=overwrite_output_if_exists,
+        no_round=no_round,
+        slide_reader=slide_reader,
+        batch_size=batch_size,
+        chunk_size=chunk_size,
+        level_cache_dir=level_cache_dir,
+        tile_cache_bytes=tile_cache_bytes,
+        pipeline=Pipeline.parse(pipeline) if pipeline else None).run()
+
+
+def multi(input_path: str,
+          *,
+          model: ('m', parameters.multi(min=1)),
+          level: (int, 'l'),
+          output_dir: (str, 'o'),
+          threshold: (float, 't') = None,
+          gpu: (int, parameters.multi()) = None,
+          writer: ('w', parameters.one_of(*list(STORAGE.keys()))) = list(
+              STORAGE.keys())[0],
+          overwrite_output_if_exists: 'overwrite' = False,
+          no_round: bool = False,
+          slide_reader: ('r', parameters.one_of('ecvl', 'openslide',
+                                                'zarr')) = 'ecvl',
+          chunk_size: int = None,
+          batch_size: ('b', _batch_size) = None,
+          level_cache_dir: str = None,
+          tile_cache_bytes: int = None,
+          pipeline: str = None):
+    """
+    Classifies the slides with several pixel models in a single pass,
+    each given as label=model, e.g. -m tissue=tissue.bin
+    -m tissue-v2=tissue-v2.bin; all the masks are written to the same
+    output.
+    """
+    stages = []
+    for spec in model:
+        label, _, path = spec.partition('=')
+        if not label or not path:
+            raise ValueError(f'invalid model {spec}, expected label=model')
+        stages.append(Stage(label.strip(), path.strip(), level))
+
+    CascadeRunner(
+        input_path,
+        output_dir,
+        stages,
+        writer=writer,
+        threshold=threshold,
+        gpu=_convert_gpu_params(gpu),
+        overwrite_output_if_exists=overwrite_output_if_exists,
+        no_round=no_round,
+        slide_reader=slide_reader,
+        batch_size=batch_size,
+        chunk_size=chunk_size,
+        level_cache_dir=level_cache_dir,
+        tile_cache_bytes=tile_cache_bytes,
+        pipeline=Pipeline.parse(pipeline) if pipeline else None).run()
+
+
+def _parse_condition(condition: str) -> Tuple[str, str, float]:
+    """
+    Returns the mask label, the comparison method and the value of a
+    condition like "tissue>0.8".
+    """
+    operator_mapping = {
+        '>': '__gt__',
+        '>=': '__ge__',
+        '<': '__lt__',
+        '<=': '__le__',
+        '==': '__eq__',
+        '!=': '__ne__',
+    }
+
+    condition = condition.replace('"', '')
+    parsed = re.match(
+        r"(?P<mask>\w+)\s*(?P<operator>[<>=!]+)\s*(?P<value>\d+\.*\d*)",
+        condition)
+    if parsed is None or parsed['operator'] not in operator_mapping:
+        raise ValueError(f'invalid condition {condition}')
+    return parsed['mask'], operator_mapping[parsed['operator']], float(
+        parsed['value'])
+
+
 def _convert_gpu_params(gpu: List[int]) -> List[int]:
     if gpu:
         res = np.zeros(max(gpu) + 1, dtype='uint8')
@@ -304,16 +830,76 @@ def _prepare_output_dir(output_dir):
     os.makedirs(output_dir, exist_ok=True)
 
 
-def _get_slides(input_path, slide_reader):
-
+def _get_output_path(output_dir: str, path: str, writer: str) -> str:
+    return os.path.join(output_dir, f'{os.path.basename(path)}.{writer}')
+
+
+def _get_cache_key(path: str,
+                   model_factory: ModelFactory,
+                   label: str,
+                   level: int,
+                   threshold: float,
+                   no_round: bool,
+                   _filter: str = None,
+                   filter_slide: str = None) -> str:
+    return ResultCache.get_key(
+        path,
+        model_factory.filename,
+        label=label,
+        level=level,
+        threshold=threshold,
+        round_to_0_100=not no_round,
+        _filter=_filter,
+        filter_slide=array_fingerprint(filter_slide,
+                                       _parse_condition(_filter)[0])
+        if _filter else None,
+        lut=model_factory.lut_dtype if model_factory.lut else None)
+
+
+def _get_run_key(model_factory: ModelFactory,
+                 _filter: str = None,
+                 filter_slide: str = None) -> str:
+    return json.dumps([
+        file_digest(model_factory.filename), _filter,
+        array_fingerprint(filter_slide,
+                          _parse_condition(_filter)[0]) if _filter else None,
+        model_factory.lut_dtype if model_factory.lut else None
+    ])
+
+
+def _get_slide_paths(input_path) -> List[str]:
     inputs = [
         os.path.abspath(os.path.join(input_path, f))
-        for f in os.listdir(input_path)
+        for f in sorted(os.listdir(input_path))
     ] if os.path.isdir(input_path) and os.path.splitext(
         input_path)[-1][1:] not in STORAGE.keys() else [input_path]
     logging.info('processing inputs %s', inputs)
-    for f in inputs:
-        yield SlideFactory(f, slide_reader, 'base').get_slide()
+    return inputs
+
+
+def _get_slide(path,
+               slide_reader,
+               level_cache_dir=None,
+               tile_cache_bytes=None):
+    return SlideFactory(path,
+                        slide_reader,
+                        'base',
+                        level_cache_dir=level_cache_dir,
+                        tile_cache_bytes=tile_cache_bytes).get_slide()
+
+
+# state of the worker processes of Runner._run_in_pool
+_worker_runner: Runner = None
+
+
+def _init_worker(runner: Runner):
+    global _worker_runner
+    runner.model = runner.model_factory.get_model()
+    _worker_runner = runner
+
 
-    def _get_slide(path, slide_reader):
-        return SlideFactory(path, slide_reader, 'base').get_slide()
+def _run_worker(path: str, key: str) -> str:
+    slide = _get_slide(path, _worker_runner.slide_reader,
+                       _worker_runner.level_cache_dir,
+                       _worker_runner.tile_cache_bytes)
+    return _worker_runner._run_slide(slide, key)
@@ -1,6 +1,9 @@
+import dataclasses
 import logging
 from typing import Dict
 
+import zarr
+
 from slaid.commons import Mask
 from slaid.commons.zarr import GroupArrayFactory
 from slaid.writers import Storage
@@ -21,11 +24,32 @@ class ZarrStorage(Storage, GroupArrayFactory, _name='zarr,zip'):
             array.attrs[attr] = value
 
     def load(self) -> Mask:
+        """
+        Loads the mask from the array and its attributes; attributes that
+        are not fields of Mask (e.g. the result cache key) are skipped.
+        """
         array = self._root[self.name]
-        kwargs = array.attrs.asdict()
+        fields = {field.name for field in dataclasses.fields(Mask)}
+        kwargs = {k: v for k, v in array.attrs.asdict().items() if k in fields}
         kwargs['array'] = array
-        kwargs.pop('dzi_sampling_level')
         return Mask(**kwargs)
 
     def mask_exists(self) -> bool:
         return len(list(self._root.arrays())) > 0
+
+    def get_array_metadata(self) -> Dict:
+        if self.name not in self._root:
+            return {}
+        return self._root[self.name].attrs.asdict()
+
+    def add_array_metadata(self, metadata: Dict):
+        self._root[self.name].attrs.update(metadata)
+
+    def copy(self, source: "ZarrStorage"):
+        """
+        Replaces the array with the one of source, with its metadata and
+        the metadata of its group.
+        """
+        self.clear()
+        zarr.copy(source._root[source.name], self._root, name=self.name)
+        self.add_metadata(source._root.attrs.asdict())
@@ -88,6 +88,54 @@ def test_classifies_with_no_round(classifier, tmp_path, model):
     assert (np.array(output[label]) <= 1).all()
 
 
+@pytest.mark.parametrize(
+    'model',
+    ['slaid/resources/models/tissue_model-extract_tissue_eddl_1.1.bin'])
+def test_classifies_with_tile_cache(tmp_path, model):
+    label = 'tissue'
+    outputs = []
+    for i, args in enumerate([[], ['--tile-cache-bytes', str(2**26)]]):
+        path = str(tmp_path / str(i))
+        cmd = [
+            'classify.py', 'fixed-batch', '-L', label, '-m', model, '-l', '2',
+            '-o', path, input_
+        ] + args
+        logger.info('running cmd %s', ' '.join(cmd))
+        subprocess.check_call(cmd)
+        slide, output = get_input_output(
+            os.path.join(path, f'{input_basename}.zarr'))
+        _test_output(label, output, slide, 2, model)
+        outputs.append(np.array(output[label]))
+    assert (outputs[0] == outputs[1]).all()
+
+
+@pytest.mark.parametrize(
+    'model',
+    ['slaid/resources/models/tissue_model-extract_tissue_eddl_1.1.bin'])
+def test_classifies_with_workers(tmp_path, model):
+    input_dir = tmp_path / 'input'
+    input_dir.mkdir()
+    slides = [str(input_dir / f'{i}-{input_basename}') for i in range(2)]
+    for path in slides:
+        os.symlink(input_, path)
+    (input_dir / 'broken.tif').write_text('not a slide')
+    output_dir = str(tmp_path / 'output')
+    label = 'tissue'
+    cmd = [
+        'classify.py', 'fixed-batch', '-L', label, '-m', model, '-l', '2',
+        '-o', output_dir, '--workers', '2',
+        str(input_dir)
+    ]
+    logger.info('running cmd %s', ' '.join(cmd))
+    # the broken slide fails alone, the others are classified anyway
+    assert subprocess.call(cmd) != 0
+    for path in slides:
+        output_path = os.path.join(output_dir,
+                                   f'{os.path.basename(path)}.zarr')
+        slide, output = get_input_output(output_path, path)
+        _test_output(label, output, slide, 2, model)
+
+
 @pytest.mark.skip(reason="to be updated")
 class TestSerialPatchClassifier:
     model = 'tests/models/all_one_by_patch.pkl'
@@ -204,6 +252,66 @@ def test_classifies_with_filter(classifier, slide, storage, tmp_path):
     subprocess.check_call(tumor)
 
 
+@pytest.mark.parametrize('slide', ['tests/data/patch-8-level.tif'])
+def test_classifies_with_cascade(slide, tmp_path):
+    tissue_model = 'slaid/resources/models/tissue_model-eddl_2.bin'
+    tumor_model = 'slaid/resources/models/tumor_model-level_1.bin'
+    cmd = [
+        'classify.py',
+        'cascade',
+        '-s',
+        f'tissue,{tissue_model},8',
+        '-s',
+        f'tissue-high-res,{tissue_model},3,tissue>0.8',
+        '-s',
+        f'tumor,{tumor_model},0,tissue>0.8',
+        '-o',
+        str(tmp_path),
+        slide,
+    ]
+    print(' '.join(cmd))
+    subprocess.check_call(cmd)
+    output_path = os.path.join(str(tmp_path),
+                               f'{os.path.basename(slide)}.zarr')
+    slide, output = get_input_output(output_path, slide)
+
+    _test_output('tissue', output, slide, 8, tissue_model)
+    _test_output('tumor', output, slide, 0, tumor_model, 256)
+    assert output['tissue-high-res'].attrs['extraction_level'] == 3
+
+    # stages cannot append to the same zip store
+    with pytest.raises(subprocess.CalledProcessError):
+        subprocess.check_call(cmd[:2] + ['-w', 'zip'] + cmd[2:])
+
+
+@pytest.mark.parametrize('slide', ['tests/data/patch-8-level.tif'])
+def test_classifies_with_multi(slide, tmp_path):
+    tissue_model = 'slaid/resources/models/tissue_model-eddl_2.bin'
+    cmd = [
+        'classify.py',
+        'multi',
+        '-m',
+        f'tissue={tissue_model}',
+        '-m',
+        f'tissue-copy={tissue_model}',
+        '-l',
+        '8',
+        '-o',
+        str(tmp_path),
+        slide,
+    ]
+    print(' '.join(cmd))
+    subprocess.check_call(cmd)
+    output_path = os.path.join(str(tmp_path),
+                               f'{os.path.basename(slide)}.zarr')
+    slide, output = get_input_output(output_path, slide)
+
+    _test_output('tissue', output, slide, 8, tissue_model)
+    _test_output('tissue-copy', output, slide, 8, tissue_model)
+    assert (np.array(output['tissue']) == np.array(
+        output['tissue-copy'])).all()
+
+
 @pytest.mark.parametrize('classifier', ['fixed-batch'])
 @pytest.mark.parametrize('model',
                          ['slaid/resources/models/tumor_model-level_1.bin'])
@@ -336,6 +444,26 @@ def test_real_case_classification(classifier, mirax_slide, chunk_size,
     assert (output_tumor == expected_tumor).all()
 
 
+@pytest.mark.parametrize(
+    'model',
+    ['slaid/resources/models/tissue_model-extract_tissue_eddl_1.1.bin'])
+def test_classifies_zarr_slide(tmp_path, model):
+    zarr_slide = str(tmp_path / f'{input_basename_no_ext}.zarr')
+    subprocess.check_call(
+        ['convert_to_zarr.py', input_, zarr_slide, '-t', '128', '-w', '2'])
+
+    output_dir = str(tmp_path / 'output')
+    label = 'tissue'
+    cmd = [
+        'classify.py', 'fixed-batch', '-L', label, '-m', model, '-l', '2',
+        '-r', 'zarr', '-o', output_dir, zarr_slide
+    ]
+    subprocess.check_call(cmd)
+    output = zarr.open_group(
+        os.path.join(output_dir, f'{os.path.basename(zarr_slide)}.zarr'))
+    assert output[label].shape == slide.level_dimensions[2][::-1]
+
+
 def test_annotate_onnx(onnx_path):
     pixel_format = 'Bgr8'
     pixel_range = 'NominalRange_0_255'
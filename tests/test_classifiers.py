@@ -1,15 +1,26 @@
+import os
+import pickle
 import unittest
 
 import numpy as np
 import pytest
 
-from slaid.classifiers.fixed_batch import (FilteredPatchClassifier,
+from slaid.classifiers import BasicClassifier
+from slaid.classifiers.fixed_batch import (BatchIterator,
+                                           FilteredPatchClassifier,
                                            FilteredPixelClassifier,
-                                           PixelClassifier)
+                                           MultiPixelClassifier,
+                                           PixelClassifier, RowSplitter)
+from slaid.classifiers.pipeline import Pipeline
+from slaid.classifiers.tuner import BatchSizeTuner
 from slaid.commons import Mask
-from slaid.commons.base import Filter, Slide
+from slaid.commons.base import Filter, ImageInfo, Slide
 from slaid.commons.ecvl import BasicSlide as EcvlSlide
 from slaid.commons.openslide import BasicSlide as OpenSlide
+from slaid.models.commons import Factory as PickleFactory
+from slaid.models.factory import Factory as ModelFactory
+from slaid.models.lut import LUTModel
+from slaid.models.parallel import ParallelModel
 from slaid.writers.zarr_io import ZarrStorage
 from tests.commons import EddlGreenPatchModel, GreenModel
 
@@ -19,12 +30,22 @@ from tests.commons import EddlGreenPatchModel, GreenModel
                                             (Slide, (OpenSlide, ))])
 @pytest.mark.parametrize("model", [GreenModel()])
 @pytest.mark.parametrize("chunk_size", [None, 11, 100])
+@pytest.mark.parametrize("read_ahead", [0, 2])
+@pytest.mark.parametrize("pipeline", [None, Pipeline(2, 2, 1, 1, 2)])
+@pytest.mark.parametrize("batch_size", [8, 'auto'])
 @pytest.mark.parametrize("slide_path", ["tests/data/test.tif"])
 @pytest.mark.parametrize("classifier_cls", [PixelClassifier])
-def test_classify_slide(slide, classifier_cls, model, level, chunk_size):
+def test_classify_slide(slide, classifier_cls, model, level, chunk_size,
+                        read_ahead, pipeline, batch_size):
     green_slide = slide
-    classifier = classifier_cls(model, "test", chunk_size=chunk_size)
-    mask = classifier.classify(green_slide, level=level)
+    classifier = classifier_cls(model,
+                                "test",
+                                chunk_size=chunk_size,
+                                read_ahead=read_ahead,
+                                pipeline=pipeline)
+    if batch_size == 'auto':
+        batch_size = BatchSizeTuner(min_size=16)
+    mask = classifier.classify(green_slide, level=level, batch_size=batch_size)
 
     assert mask.array.shape == green_slide.level_dimensions[level][::-1]
     green_zone = int(300 // green_slide.level_downsamples[level])
@@ -32,13 +53,262 @@ def test_classify_slide(slide, classifier_cls, model, level, chunk_size):
     assert (mask.array[green_zone:, :] == 0).all()
 
 
+class CountingGreenModel(GreenModel):
+
+    def __init__(self, image_info):
+        super().__init__()
+        self.image_info = image_info
+        self.predicted = 0
+
+    def predict(self, array):
+        self.predicted += array.size // 3
+        return (array[1] if self.image_info.channel == ImageInfo.Channel.FIRST
+                else array[:, 1]) / 255
+
+
+@pytest.mark.parametrize("slide_cls,args", [(Slide, (EcvlSlide, )),
+                                            (Slide, (OpenSlide, ))])
+@pytest.mark.parametrize("slide_path", ["tests/data/test.tif"])
+@pytest.mark.parametrize("image_info", [
+    ImageInfo.create('rgb', 'yx', 'last'),
+    ImageInfo.create('bgr', 'yx', 'first'),
+    ImageInfo.create('rgb', 'yx', 'last', '0_1')
+])
+def test_classify_with_dedup(slide, image_info):
+    expected = PixelClassifier(CountingGreenModel(image_info),
+                               "test").classify(slide,
+                                                level=0,
+                                                batch_size=10000)
+    model = CountingGreenModel(image_info)
+    mask = PixelClassifier(model, "test",
+                           dedup=True).classify(slide,
+                                                level=0,
+                                                batch_size=10000)
+
+    assert (mask.array == expected.array).all()
+    assert model.predicted < mask.array.size
+
+    filter_array = np.ones(
+        (mask.array.shape[0] // 10, mask.array.shape[1] // 10), dtype='bool')
+    mask = FilteredPixelClassifier(model,
+                                   "test",
+                                   Filter(None, filter_array),
+                                   dedup=True).classify(slide,
+                                                        level=0,
+                                                        batch_size=10000)
+    rows = filter_array.shape[0] * (mask.array.shape[0] //
+                                    filter_array.shape[0])
+    cols = filter_array.shape[1] * (mask.array.shape[1] //
+                                    filter_array.shape[1])
+    assert (mask.array[:rows, :cols] == expected.array[:rows, :cols]).all()
+
+
+@pytest.mark.parametrize("slide_cls,args", [(Slide, (EcvlSlide, )),
+                                            (Slide, (OpenSlide, ))])
+@pytest.mark.parametrize("slide_path", ["tests/data/test.tif"])
+@pytest.mark.parametrize("model", [GreenModel()])
+def test_classify_with_lut_model(slide, model, tmp_path):
+    model_path = tmp_path / 'model.pkl'
+    model_path.write_bytes(b'green')
+    lut_model = LUTModel.create(model,
+                                str(model_path),
+                                dtype='uint8',
+                                cache_dir=str(tmp_path))
+    assert os.path.exists(
+        LUTModel.get_path(model, str(model_path), 'uint8', str(tmp_path)))
+    assert str(lut_model) == str(model)
+
+    expected = PixelClassifier(model, "test").classify(slide, level=0)
+    mask = PixelClassifier(lut_model, "test").classify(slide, level=0)
+    assert (mask.array == expected.array).all()
+
+
+@pytest.mark.parametrize("slide_cls,args", [(Slide, (EcvlSlide, )),
+                                            (Slide, (OpenSlide, ))])
+@pytest.mark.parametrize("slide_path", ["tests/data/test.tif"])
+@pytest.mark.parametrize("model", [GreenModel()])
+def test_classify_with_replicas(slide, model, tmp_path):
+    model_path = str(tmp_path / 'model.pkl')
+    with open(model_path, 'wb') as f:
+        pickle.dump(model, f)
+    parallel_model = ParallelModel([PickleFactory(model_path)] * 2)
+    assert parallel_model.image_info == model.image_info
+    assert parallel_model.patch_size is None
+
+    expected = PixelClassifier(model, "test").classify(slide, level=0)
+    mask = PixelClassifier(parallel_model, "test").classify(slide,
+                                                            level=0,
+                                                            batch_size=1000)
+    parallel_model.close()
+    assert (mask.array == expected.array).all()
+
+
+def test_replicas_split_cpu_threads():
+    factory = ModelFactory('model.bin', replicas=2)
+    threads = max(1, os.cpu_count() // 2)
+    assert factory._get_replica_factory(1)._kwargs['threads'] == threads
+
+    factory = ModelFactory('model.bin', replicas=2, gpu=[1, 1])
+    assert factory._get_replica_factory(1)._kwargs == {'gpu': [0, 1]}
+
+
+def test_factory_gets_patch_size_without_model():
+    # the model files do not exist, they are not read
+    assert ModelFactory('tumor_model-level_1.bin').get_patch_size() == (256,
+                                                                        256)
+    assert ModelFactory('tissue_model-level_1.bin').get_patch_size() is None
+
+
+@pytest.mark.parametrize("slide_cls,args", [(Slide, (EcvlSlide, )),
+                                            (Slide, (OpenSlide, ))])
+@pytest.mark.parametrize("slide_path", ["tests/data/test.tif"])
+@pytest.mark.parametrize("pipeline", [None, Pipeline()])
+@pytest.mark.parametrize("chunk_size", [10, 25])
+def test_classify_resumes_from_journal(slide, pipeline, chunk_size, tmp_path):
+    image_info = ImageInfo.create('rgb', 'yx', 'last')
+    output = str(tmp_path / 'output.zarr')
+    expected = PixelClassifier(CountingGreenModel(image_info),
+                               "test",
+                               ZarrStorage('test', output),
+                               chunk_size=chunk_size,
+                               pipeline=pipeline).classify(slide, level=0)
+    expected = np.array(expected.array)
+
+    # as if the run was interrupted after the first 30 rows
+    storage = ZarrStorage('test', output)
+    journal = storage.journal(expected.shape[0])
+    assert journal.is_done(0, len(journal))
+    journal._array[30:] = False
+    storage._root['test'][30:] = 0
+
+    model = CountingGreenModel(image_info)
+    mask = PixelClassifier(model,
+                           "test",
+                           ZarrStorage('test', output),
+                           chunk_size=chunk_size,
+                           pipeline=pipeline).classify(slide, level=0)
+    assert (np.array(mask.array) == expected).all()
+    assert model.predicted == (
+        expected.shape[0] - 30 // chunk_size * chunk_size) * expected.shape[1]
+    assert journal.is_done(0, len(journal))
+
+    # rows of a run with other parameters are not resumed
+    model = CountingGreenModel(image_info)
+    mask = PixelClassifier(model,
+                           "test",
+                           ZarrStorage('test', output),
+                           chunk_size=chunk_size,
+                           pipeline=pipeline).classify(slide,
+                                                       level=0,
+                                                       threshold=0.5)
+    assert model.predicted == expected.size
+    assert set(np.unique(mask.array)) <= {0, 100}
+
+    storage.clear()
+    assert 'test' not in storage._root
+    assert storage.journal_name not in storage._root
+
+
+@pytest.mark.parametrize("slide_cls,args", [(Slide, (EcvlSlide, )),
+                                            (Slide, (OpenSlide, ))])
+@pytest.mark.parametrize("slide_path", ["tests/data/test.tif"])
+@pytest.mark.parametrize("pipeline", [None, Pipeline()])
+def test_multi_pixel_classifier(slide, pipeline, tmp_path):
+    output = str(tmp_path / 'output.zarr')
+    image_infos = {
+        'last': ImageInfo.create('rgb', 'yx', 'last'),
+        'first': ImageInfo.create('bgr', 'yx', 'first')
+    }
+    expected = {
+        label:
+        np.array(
+            PixelClassifier(CountingGreenModel(image_info),
+                            label,
+                            chunk_size=10).classify(slide, level=0).array)
+        for label, image_info in image_infos.items()
+    }
+
+    models = {
+        label: CountingGreenModel(image_info)
+        for label, image_info in image_infos.items()
+    }
+    classifiers = [
+        PixelClassifier(model,
+                        label,
+                        ZarrStorage(label, output),
+                        chunk_size=10) for label, model in models.items()
+    ]
+    masks = MultiPixelClassifier(classifiers,
+                                 pipeline=pipeline).classify(slide,
+                                                             level=0,
+                                                             batch_size={
+                                                                 'last': 8,
+                                                                 'first': 100
+                                                             })
+    assert set(masks) == set(image_infos)
+    for label, mask in masks.items():
+        assert (np.array(mask.array) == expected[label]).all()
+        assert models[label].predicted == expected[label].size
+
+    # completed classifiers do not predict again
+    models['first'].predicted = 0
+    ZarrStorage('last', output).clear()
+    MultiPixelClassifier(classifiers, pipeline=pipeline).classify(slide,
+                                                                  level=0)
+    assert models['first'].predicted == 0
+    assert models['last'].predicted == 2 * expected['last'].size
+
+    with pytest.raises(ValueError):
+        MultiPixelClassifier(classifiers + classifiers[:1])
+
+
+@pytest.mark.parametrize("level", [0])
+@pytest.mark.parametrize("slide_cls,args", [(Slide, (EcvlSlide, )),
+                                            (Slide, (OpenSlide, ))])
+@pytest.mark.parametrize("model", [GreenModel()])
+@pytest.mark.parametrize("chunk", [None, (11, 100), (100, 11)])
+@pytest.mark.parametrize("slide_path", ["tests/data/test.tif"])
+@pytest.mark.parametrize("array_factory", [None, ZarrStorage])
+def test_basic_classifier(slide, model, level, chunk, array_factory, tmp_path):
+    if array_factory:
+        array_factory = array_factory('test', f'{tmp_path}.zarr')
+    classifier = BasicClassifier(model,
+                                 "test",
+                                 array_factory=array_factory,
+                                 chunk=chunk)
+    mask = classifier.classify(slide, level=level)
+
+    assert mask.array.shape == slide.level_dimensions[level][::-1]
+    green_zone = int(300 // slide.level_downsamples[level])
+    assert (mask.array[:green_zone, :] == 100).all()
+    assert (mask.array[green_zone:, :] == 0).all()
+
+
+@pytest.mark.parametrize("slide_cls,args", [(Slide, (EcvlSlide, )),
+                                            (Slide, (OpenSlide, ))])
+@pytest.mark.parametrize("model", [EddlGreenPatchModel((50, 50))])
+@pytest.mark.parametrize("chunk", [None, (100, 200)])
+@pytest.mark.parametrize("slide_path", ["tests/data/test.tif"])
+def test_basic_classifier_by_patches(slide, model, chunk):
+    classifier = BasicClassifier(model, "test", chunk=chunk)
+    mask = classifier.classify(slide, level=0)
+
+    dims = slide.level_dimensions[0][::-1]
+    assert mask.array.shape == (dims[0] // model.patch_size[0],
+                                dims[1] // model.patch_size[1])
+    green_zone = 300 // model.patch_size[0]
+    assert (mask.array[:green_zone, :] == 100).all()
+    assert (mask.array[green_zone:, :] == 0).all()
+
+
 @pytest.mark.parametrize("level", [0])
 @pytest.mark.parametrize("slide_cls,args", [(Slide, (EcvlSlide, )),
                                             (Slide, (OpenSlide, ))])
 @pytest.mark.parametrize("classifier_cls", [FilteredPixelClassifier])
 @pytest.mark.parametrize("slide_path", ["tests/data/test.tif"])
 @pytest.mark.parametrize("model", [GreenModel()])
-def test_classify_with_filter(slide, classifier_cls, level, model):
+@pytest.mark.parametrize("pipeline", [None, Pipeline(2, 2, 1, 1, 2)])
+def test_classify_with_filter(slide, classifier_cls, level, model, pipeline):
     green_slide = slide
     filter_level = 2
     filter_downsample = green_slide.level_downsamples[filter_level]
@@ -48,7 +318,10 @@ def test_classify_with_filter(slide, classifier_cls, level, model):
     filter_array[:ones_row, :ones_col] = 1
     filter_mask = Mask(filter_array, filter_level, filter_downsample,
                        green_slide.level_dimensions)
-    classifier = classifier_cls(model, "test", filter_mask >= 1)
+    classifier = classifier_cls(model,
+                                "test",
+                                filter_mask >= 1,
+                                pipeline=pipeline)
     mask = classifier.classify(green_slide, level=level)
 
     ones_row = round(ones_row * filter_downsample //
@@ -118,8 +391,10 @@ def test_classify_slide_by_patches_with_filter_all_zeros(
 @pytest.mark.parametrize("level", [0])
 @pytest.mark.parametrize("array_factory", [ZarrStorage])
 @pytest.mark.parametrize("model", [EddlGreenPatchModel((50, 50))])
+@pytest.mark.parametrize("pipeline", [None, Pipeline(2, 2, 1, 1, 2)])
 def test_classify_slide_by_patches_with_filter(classifier_cls, slide, level,
-                                               model, array_factory, tmp_path):
+                                               model, array_factory, pipeline,
+                                               tmp_path):
     green_slide = slide
     filter_array = np.zeros(
         (
@@ -133,7 +408,8 @@ def test_classify_slide_by_patches_with_filter(classifier_cls, slide, level,
                                 "test",
                                 Filter(None, filter_array),
                                 array_factory=array_factory(
-                                    'test', f'{tmp_path}.zarr'))
+                                    'test', f'{tmp_path}.zarr'),
+                                pipeline=pipeline)
     mask = classifier.classify(green_slide, level=level)
 
     dims = green_slide.level_dimensions[level][::-1]
@@ -148,6 +424,35 @@ def test_classify_slide_by_patches_with_filter(classifier_cls, slide, level,
     assert (mask.array[2:, :] == 0).all()
 
 
+@pytest.mark.parametrize("slide_cls,args", [(Slide, (EcvlSlide, )),
+                                            (Slide, (OpenSlide, ))])
+@pytest.mark.parametrize("slide_path", ["tests/data/test.tif"])
+@pytest.mark.parametrize("model", [EddlGreenPatchModel((50, 50))])
+@pytest.mark.parametrize("batch_size", [1, 3, 100])
+@pytest.mark.parametrize("max_read_size", [50, 2048])
+def test_classify_patches_streams_batches(slide, model, batch_size,
+                                          max_read_size):
+    dims = slide.level_dimensions[0][::-1]
+    # the last row and column of the filter fall on incomplete patches
+    filter_array = np.zeros((dims[0] // model.patch_size[0] + 1,
+                             dims[1] // model.patch_size[1] + 1),
+                            dtype="bool")
+    filter_array[1, :] = True
+    filter_array[:, -1] = True
+    filter_array[-1, :] = True
+    classifier = FilteredPatchClassifier(model,
+                                         "test",
+                                         Filter(None, filter_array),
+                                         max_read_size=max_read_size)
+    mask = classifier.classify(slide, level=0, batch_size=batch_size)
+
+    assert mask.array.shape == (dims[0] // model.patch_size[0],
+                                dims[1] // model.patch_size[1])
+    selected = filter_array[:mask.array.shape[0], :mask.array.shape[1]]
+    assert (mask.array[1, :] == 100).all()
+    assert (mask.array[~selected] == 0).all()
+
+
 @pytest.mark.parametrize(
     "model_filename",
     ['slaid/resources/models/promort_vgg16_weights_ep_9_vacc_0.85.bin'])
@@ -202,6 +507,108 @@ def test_classifies_tissue(slide, tissue_model, patch_tissue_mask):
     assert (mask.array[:16, :16] == patch_tissue_mask[:16, :16]).all()
 
 
+@pytest.mark.parametrize("channel_first", [True, False])
+@pytest.mark.parametrize("batch_size", [1, 7, 64])
+def test_batch_iterator(channel_first, batch_size):
+    axis = 1 if channel_first else 0
+    batch_iterator = BatchIterator(batch_size, channel_first)
+    appended, batches = [], []
+    for size in [0, 5, 30, 3, 100, 1, 64]:
+        array = np.arange(
+            size * 3,
+            dtype='uint8').reshape((3, size) if channel_first else (size, 3))
+        appended.append(array)
+        batch_iterator.append(array)
+        for batch in batch_iterator.iter():
+            assert batch.shape[axis] == batch_size
+            batches.append(batch.copy())
+
+    remaining = batch_iterator.buffer
+    assert remaining.shape[axis] < batch_size
+    assert (np.concatenate(batches + [remaining],
+                           axis) == np.concatenate(appended, axis)).all()
+
+
+@pytest.mark.parametrize("col_size", [1, 7, 64])
+def test_row_splitter(col_size):
+    row_splitter = RowSplitter(col_size)
+    data = np.arange(500, dtype='float32')
+    rows, offset = [], 0
+    for size in [0, 5, 30, 3, 100, 1, 64, 297]:
+        row_splitter.append(data[offset:offset + size])
+        offset += size
+        try:
+            row_index, split = row_splitter.split()
+        except RowSplitter.RowsNotFound:
+            continue
+        assert row_index == sum(r.shape[0] for r in rows)
+        assert split.shape[1] == col_size
+        rows.append(split.copy())
+        with pytest.raises(RowSplitter.RowsNotFound):
+            row_splitter.split()
+
+    rows = np.concatenate(rows).reshape(-1)
+    assert rows.size == 500 - 500 % col_size
+    assert (rows == data[:rows.size]).all()
+
+
+def test_pipeline_reports_stage_stats():
+    pipeline = Pipeline(read_workers=2, queue_size=1)
+    written = []
+    stats = pipeline.run(range(10), lambda x: x + 1, lambda x: x * 2,
+                         lambda x: x - 1, written.append)
+
+    assert sorted(written) == [(x + 1) * 2 - 1 for x in range(10)]
+    assert list(stats) == list(Pipeline.STAGES)
+    for stage_stats in stats.values():
+        assert stage_stats.items == 10
+        assert 0 <= stage_stats.utilisation <= 1
+
+
+def test_pipeline_raises_stage_errors():
+
+    def predict(x):
+        if x == 3:
+            raise ValueError(x)
+        return x
+
+    with pytest.raises(ValueError):
+        Pipeline(queue_size=1).run(range(100), lambda x: x, lambda x: x,
+                                   predict, lambda x: None)
+
+
+def test_pipeline_parse():
+    assert Pipeline.parse('2,3') == Pipeline(read_workers=2, convert_workers=3)
+    for spec in ['a', '1,0', '1,1,1,1,1', '1,1,1,2']:
+        with pytest.raises(ValueError):
+            Pipeline.parse(spec)
+
+
+def test_batch_size_tuner():
+
+    def latency(size):
+        # per item cost triples past 2**14 items
+        return 1e-3 + size * (1e-7 if size <= 2**14 else 3e-7)
+
+    tuner = BatchSizeTuner(min_size=1024)
+    for _ in range(100):
+        size = tuner.batch_size
+        tuner.update(size, size * 3, latency(size))
+    assert not tuner.searching
+    assert tuner.batch_size == 2**14
+
+    for _ in range(tuner.samples + 1):
+        tuner.update(2**14, 2**14 * 3, latency(2**14) * 3)
+    assert tuner.searching
+    assert tuner.batch_size == 1024
+
+    tuner = BatchSizeTuner(min_size=1024, max_bytes=4096 * 3)
+    for _ in range(100):
+        size = tuner.batch_size
+        tuner.update(size, size * 3, 1e-3 + size * 1e-9)
+    assert tuner.batch_size == 4096
+
+
 #  @pytest.mark.parametrize("model_filename", [
 #      'https://space.crs4.it/s/GcCd8EQx5W84zrK/download/tumor_model-level_1-v2.1.onnx'
 #  ])
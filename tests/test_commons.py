@@ -1,11 +1,17 @@
+import asyncio
+import os
+import pickle
 import unittest
 
 import numpy as np
 import pytest
 
-from slaid.commons.base import ImageInfo, Slide
+from slaid.commons.base import (ImageInfo, LevelCache, Slide, TileCache,
+                                as_blocks, coalesce_cells, snap_chunk_to_tiles)
 from slaid.commons.ecvl import BasicSlide as EcvlSlide
 from slaid.commons.openslide import BasicSlide as OpenSlide
+from slaid.commons.zarr import BasicSlide as ZarrSlide
+from slaid.commons.zarr import write_slide
 
 IMAGE = 'tests/data/test.tif'
 
@@ -48,6 +54,286 @@ def test_slice_slide(slide, image_info):
     assert (slide_array.array == image_array).all()
 
 
+@pytest.mark.parametrize('slide_reader', [EcvlSlide, OpenSlide])
+def test_tile_cache(slide_reader):
+    tile_cache = TileCache(tile_size=64)
+    slide = Slide(slide_reader(IMAGE), tile_cache=tile_cache)
+    uncached_slide = Slide(slide_reader(IMAGE))
+    for level in range(slide.level_count):
+        location = (int(10 * slide.level_downsamples[level]),
+                    int(20 * slide.level_downsamples[level]))
+        expected = uncached_slide.read_region(location, level,
+                                              (100, 50)).to_array()
+        assert (slide.read_region(location, level,
+                                  (100, 50)).to_array() == expected).all()
+        misses = tile_cache.misses
+        assert (slide.read_region(location, level,
+                                  (100, 50)).to_array() == expected).all()
+        assert tile_cache.misses == misses
+    assert tile_cache.hits > 0
+    assert (slide[0][:, :].array == uncached_slide[0][:, :].array).all()
+
+
+@pytest.mark.parametrize('slide_reader', [EcvlSlide, OpenSlide])
+@pytest.mark.parametrize('tile_cache', [None, TileCache(tile_size=64)])
+def test_slide_is_picklable(slide_reader, tile_cache):
+    slide = Slide(slide_reader(IMAGE), tile_cache=tile_cache)
+    # the executor of async reads is not sent
+    executor = slide.async_executor
+    unpickled = pickle.loads(pickle.dumps(slide))
+    assert unpickled.async_executor is not executor
+    assert unpickled.filename == slide.filename
+    assert unpickled.level_dimensions == slide.level_dimensions
+    assert unpickled.level_downsamples == slide.level_downsamples
+    assert (unpickled.read_region((0, 0), 0,
+                                  (50, 50)).to_array() == slide.read_region(
+                                      (0, 0), 0, (50, 50)).to_array()).all()
+
+
+def test_ecvl_to_array_does_not_copy():
+    image = EcvlSlide(IMAGE).read_region((0, 0), 0, (20, 10))
+    buffer = np.asarray(image._image)
+
+    array = image.to_array()
+    assert array.shape == (3, 10, 20)
+    assert np.shares_memory(array, buffer)
+
+    array = image.to_array(ImageInfo.create('bgr', 'yx', 'last'))
+    assert array.shape == (10, 20, 3)
+    assert np.shares_memory(array, buffer)
+    assert (array == np.array(buffer).transpose(2, 1, 0)[..., ::-1]).all()
+
+
+@pytest.mark.parametrize('slide_reader', [EcvlSlide, OpenSlide])
+@pytest.mark.parametrize('ext', ['zarr', 'zip'])
+def test_zarr_slide(slide_reader, ext, tmp_path):
+    source = slide_reader(IMAGE)
+    path = str(tmp_path / f'slide.{ext}')
+    write_slide(source, path, tile_size=64, workers=2)
+    slide = Slide(ZarrSlide(path))
+
+    assert slide.level_dimensions == source.level_dimensions
+    assert slide.level_downsamples == source.level_downsamples
+    assert slide.level_tile_sizes == [(64, 64)] * source.level_count
+    image_info = ImageInfo.create('rgb', 'yx', 'last')
+    for level in range(slide.level_count):
+        location = (int(10 * slide.level_downsamples[level]), 0)
+        expected = source.read_region(location, level,
+                                      (70, 30)).to_array(image_info)
+        assert (slide.read_region(location, level,
+                                  (70, 30)).to_array() == expected).all()
+
+
+@pytest.mark.parametrize('slide_reader', [EcvlSlide, OpenSlide])
+def test_zarr_slide_with_levels(slide_reader, tmp_path):
+    source = slide_reader(IMAGE)
+    path = str(tmp_path / 'slide.zarr')
+    write_slide(source, path, tile_size=64, levels=[1, 2], workers=2)
+    slide = Slide(ZarrSlide(path))
+
+    # the first written level is level 0 of the pyramid
+    assert slide.dimensions == source.level_dimensions[1]
+    assert list(slide.level_dimensions) == list(source.level_dimensions[1:])
+    assert slide.level_downsamples == [
+        1, source.level_downsamples[2] / source.level_downsamples[1]
+    ]
+    image_info = ImageInfo.create('rgb', 'yx', 'last')
+    for level in range(slide.level_count):
+        location = (int(10 * slide.level_downsamples[level]), 0)
+        source_location = (int(location[0] * source.level_downsamples[1]), 0)
+        expected = source.read_region(source_location, level + 1,
+                                      (70, 30)).to_array(image_info)
+        assert (slide.read_region(location, level,
+                                  (70, 30)).to_array() == expected).all()
+
+
+@pytest.mark.parametrize('slide_reader', [EcvlSlide, OpenSlide])
+def test_level_cache(slide_reader, tmp_path):
+    level_cache = LevelCache(str(tmp_path), rows_per_read=50)
+    slide = Slide(slide_reader(IMAGE), level_cache=level_cache)
+    uncached_slide = Slide(slide_reader(IMAGE))
+    for level in range(slide.level_count):
+        slide_array = slide[level]
+        assert isinstance(slide_array.array, np.memmap)
+        assert slide_array.size == uncached_slide[level].size
+        assert (slide_array[5:40,
+                            10:60].array == uncached_slide[level][5:40,
+                                                                  10:60].array
+                ).all()
+    assert len(_get_cached_levels(tmp_path)) == slide.level_count
+
+    other_slide = Slide(slide_reader(IMAGE), level_cache=level_cache)
+    assert (other_slide[0].array == slide[0].array).all()
+    assert len(_get_cached_levels(tmp_path)) == slide.level_count
+
+
+def test_level_cache_reads_bands_lazily(tmp_path):
+    level_cache = LevelCache(str(tmp_path), rows_per_read=50)
+    slide = Slide(EcvlSlide(IMAGE), level_cache=level_cache)
+    reads = []
+    read_region = slide._slide_reader.read_region
+    slide._slide_reader.read_region = lambda *args: reads.append(
+        args) or read_region(*args)
+    expected = Slide(EcvlSlide(IMAGE))[0][5:40, 10:60].array
+    width, height = slide.level_dimensions[0]
+
+    # a slice decodes only the bands it overlaps
+    assert (slide[0][5:40, 10:60].array == expected).all()
+    assert reads == [((0, 0), 0, (width, 50))]
+    assert (slide[0][5:40, 10:60].array == expected).all()
+    assert len(reads) == 1
+
+    assert (slide[0].array[:, 5:40, 10:60] == expected).all()
+    assert len(reads) == len(range(0, height, 50))
+
+
+def test_level_cache_is_shared_by_readers(tmp_path):
+    level_cache = LevelCache(str(tmp_path), rows_per_read=50)
+    image_info = ImageInfo.create('rgb', 'yx', 'last')
+    arrays = []
+    for slide_reader in [EcvlSlide, OpenSlide]:
+        slide = Slide(slide_reader(IMAGE), level_cache=level_cache)
+        arrays.append(slide[0][5:40, 10:60].convert(image_info).array)
+    # readers with a different layout do not share the cached level
+    assert len(_get_cached_levels(tmp_path)) == 2
+    assert (arrays[0] == arrays[1]).all()
+
+
+def _get_cached_levels(cache_dir):
+    return [name for name in os.listdir(cache_dir) if name.endswith('.npy')]
+
+
+@pytest.mark.parametrize('slide_reader', [EcvlSlide, OpenSlide])
+def test_read_region_async(slide_reader):
+    slide = Slide(slide_reader(IMAGE))
+    level = slide.level_count - 1
+    image_info = ImageInfo.create('rgb', 'yx', 'last')
+    expected = slide[level][:, :].convert(image_info).array
+
+    async def read_all():
+        images = await asyncio.gather(*[
+            slide.read_region_async((0, 0), level, (10, 10)) for _ in range(4)
+        ])
+        res = np.zeros_like(expected)
+        async for (x, y), image in slide.iter_regions_async(level, (30, 20),
+                                                            max_pending=2):
+            array = image.to_array(image_info)
+            res[y:y + array.shape[0], x:x + array.shape[1]] = array
+        return images, res
+
+    images, res = asyncio.run(read_all())
+    assert all((image.to_array(image_info) == expected[:10, :10]).all()
+               for image in images)
+    assert (res == expected).all()
+
+    executor = slide.async_executor
+    slide.close()
+    assert executor._shutdown
+    assert slide.async_executor is not executor
+    slide.close()
+
+
+def test_tile_cache_eviction():
+    tile_cache = TileCache(max_bytes=100, tile_size=10)
+    tile_cache.put((0, 0, 0), np.zeros(60, dtype='uint8'))
+    tile_cache.put((0, 1, 0), np.zeros(60, dtype='uint8'))
+    assert len(tile_cache) == 1
+    assert tile_cache.nbytes == 60
+    assert tile_cache.get((0, 0, 0)) is None
+    assert tile_cache.get((0, 1, 0)) is not None
+    assert (tile_cache.hits, tile_cache.misses) == (1, 1)
+
+
+@pytest.mark.parametrize('image_info', [
+    ImageInfo.create('bgr', 'yx', 'first', '0_1'),
+    ImageInfo.create('rgb', 'yx', 'last', '1_1'),
+    ImageInfo.create('bgr', 'yx', 'last', '0_255'),
+])
+def test_convert_into_preallocated_array(image_info):
+    array = np.arange(4 * 5 * 3, dtype='uint8').reshape(4, 5, 3)
+    source_info = ImageInfo.create('rgb', 'yx', 'last')
+    expected = array[..., ::-1] if image_info.color_type != \
+        source_info.color_type else array
+    if image_info.channel == ImageInfo.Channel.FIRST:
+        expected = expected.transpose(2, 0, 1)
+    if image_info.pixel_range == ImageInfo.Range._0_1:
+        expected = expected / 255.
+    elif image_info.pixel_range == ImageInfo.Range._1_1:
+        expected = (expected / 255.) * 2 - 1
+
+    converted = source_info.convert(array, image_info)
+    assert converted.shape == expected.shape
+    assert np.allclose(converted, expected)
+
+    out = np.empty(expected.shape,
+                   dtype='uint8' if image_info.pixel_range
+                   == ImageInfo.Range._0_255 else 'float32')
+    assert source_info.convert(array, image_info, out=out) is out
+    assert np.allclose(out, expected)
+    assert source_info.get_conversion_plan(image_info) is \
+        source_info.get_conversion_plan(image_info)
+
+
+@pytest.mark.parametrize('chunk,tile_size,multiple_of,expected', [
+    ((100, 300), (256, 256), (1, 1), (256, 256)),
+    ((1000, 1000), (256, 512), (1, 1), (1024, 1024)),
+    ((100, 100), (256, 256), (96, 96), (768, 768)),
+    ((100, 100), None, (1, 1), (100, 100)),
+])
+def test_snap_chunk_to_tiles(chunk, tile_size, multiple_of, expected):
+    assert snap_chunk_to_tiles(chunk, tile_size, multiple_of) == expected
+
+
+@pytest.mark.parametrize("max_shape", [None, (1, 1), (2, 3)])
+def test_coalesce_cells(max_shape):
+    cells = np.zeros((6, 8), dtype='bool')
+    cells[1:4, 2:7] = True
+    cells[5, :] = True
+    cells[0, 0] = True
+    rects = coalesce_cells(cells, max_shape)
+
+    covered = np.zeros(cells.shape, dtype='int')
+    for row, col, n_rows, n_cols in rects:
+        covered[row:row + n_rows, col:col + n_cols] += 1
+        if max_shape:
+            assert n_rows <= max_shape[0] and n_cols <= max_shape[1]
+    assert (covered == cells).all()
+    if max_shape is None:
+        assert len(rects) == 3
+
+
+@pytest.mark.parametrize("channel_first", [True, False])
+def test_as_blocks(channel_first):
+    array = np.arange(3 * 10 * 12, dtype='uint8').reshape(3, 10, 12)
+    if not channel_first:
+        array = array.transpose(1, 2, 0)
+    blocks = as_blocks(array, (3, 4), channel_first)
+
+    if channel_first:
+        assert blocks.shape == (3, 3, 3, 3, 4)
+        assert (blocks[2, 1] == array[:, 6:9, 4:8]).all()
+    else:
+        assert blocks.shape == (3, 3, 3, 4, 3)
+        assert (blocks[2, 1] == array[6:9, 4:8]).all()
+    assert np.shares_memory(blocks, array)
+
+
+@pytest.mark.parametrize("slide_cls,args", [(Slide, (EcvlSlide, )),
+                                            (Slide, (OpenSlide, ))])
+@pytest.mark.parametrize("slide_path", ["tests/data/test.tif"])
+@pytest.mark.parametrize("channel", ["first", "last"])
+def test_slide_array_get_blocks(slide, channel):
+    image_info = ImageInfo.create('rgb', 'yx', channel)
+    slide_array = slide[0][:100, :150].convert(image_info)
+    blocks = slide_array.get_blocks((50, 50))
+
+    assert blocks.shape[:2] == (2, 3)
+    expected = slide_array.array[:, 50:100, 100:150] if channel == 'first' \
+        else slide_array.array[50:100, 100:150]
+    assert (blocks[1, 2] == expected).all()
+    assert np.shares_memory(blocks, slide_array.array)
+
+
 def test_filter(mask):
     filter_ = mask >= 3
     assert (filter_[0, :] == 0).all()
@@ -5,6 +5,7 @@ import os
 import pytest
 
 import slaid.writers.zarr_io as zarr_io
+from slaid.cache import ResultCache, array_fingerprint, fingerprint
 
 
 @pytest.mark.parametrize('storage_cls,filename',
@@ -34,3 +35,72 @@ def test_checks_zarr_path_has_masks(storage_cls, filename, tmp_path):
     assert storage.mask_exists() is False
     storage.zeros((10, 10), 'uint8')
     assert storage.mask_exists()
+
+
+def test_result_cache_restores_results(tmp_path):
+    slide_path = tmp_path / 'slide.tif'
+    slide_path.write_bytes(os.urandom(3 * 2**20))
+    copy_path = tmp_path / 'copy.tif'
+    copy_path.write_bytes(slide_path.read_bytes())
+    model_path = tmp_path / 'model.bin'
+    model_path.write_bytes(b'model')
+
+    key = ResultCache.get_key(str(slide_path), str(model_path), level=0)
+    assert key == ResultCache.get_key(str(copy_path), str(model_path), level=0)
+    assert key != ResultCache.get_key(str(slide_path),
+                                      str(model_path),
+                                      level=1)
+    # files are identified by their whole content
+    data = bytearray(slide_path.read_bytes())
+    data[len(data) // 2] ^= 1
+    changed_path = tmp_path / 'changed.tif'
+    changed_path.write_bytes(bytes(data))
+    assert key != ResultCache.get_key(str(changed_path),
+                                      str(model_path),
+                                      level=0)
+
+    cache = ResultCache(str(tmp_path / 'cache'))
+    output_path = str(tmp_path / 'slide.zarr')
+    assert not cache.restore(key, 'test', output_path, str(slide_path))
+    # checking the output does not create it
+    assert not os.path.exists(output_path)
+    storage = zarr_io.ZarrStorage('test', output_path)
+    storage.zeros((10, 10), 'uint8')[:5] = 1
+    storage.add_metadata({'filename': str(slide_path)})
+    cache.store(key, storage)
+    assert cache.restore(key, 'test', output_path, str(slide_path))
+
+    assert cache.restore(key, 'test', str(tmp_path / 'copy.zarr'),
+                         str(copy_path))
+    restored = zarr_io.ZarrStorage('test', str(tmp_path / 'copy.zarr'))
+    assert (restored._root['test'][:] == storage._root['test'][:]).all()
+    assert restored.get_array_metadata()[ResultCache.KEY_ATTR] == key
+    assert restored._root.attrs['filename'] == str(copy_path)
+
+
+def test_mask_loads_after_cached_run(tmp_path, mask):
+    storage = zarr_io.ZarrStorage('test', str(tmp_path / 'slide.zarr'))
+    mask.array = storage.zeros((10, 10), 'uint8')
+    storage.write(mask)
+    ResultCache().store('key', storage)
+    assert storage.get_array_metadata()[ResultCache.KEY_ATTR] == 'key'
+    assert storage.load() == mask
+
+
+def test_fingerprints_follow_content(tmp_path):
+    path = str(tmp_path / 'slide.zarr')
+    storage = zarr_io.ZarrStorage('tissue', path)
+    storage.zeros((10, 10), 'uint8')[:] = 1
+    slide_fingerprint = fingerprint(path)
+    tissue_fingerprint = array_fingerprint(path, 'tissue')
+
+    # other arrays of the group do not change the fingerprint of tissue
+    zarr_io.ZarrStorage('tumor', path).zeros((10, 10), 'uint8')[:] = 1
+    assert array_fingerprint(path, 'tissue') == tissue_fingerprint
+    assert fingerprint(path) != slide_fingerprint
+
+    # same size, other content
+    slide_fingerprint = fingerprint(path)
+    storage._root['tissue'][:] = 2
+    assert array_fingerprint(path, 'tissue') != tissue_fingerprint
+    assert fingerprint(path) != slide_fingerprint